@@ -3,22 +3,59 @@ from __future__ import annotations
 
 import os
 import re
+import asyncio
+import importlib.util
+import threading
 import json
 import io
 import time
-import math
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from functools import lru_cache
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-import fitz  # PyMuPDF
 import numpy as np
-import pandas as pd
-from PIL import Image
-import easyocr
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+try:
+    import orjson  # opcional: parser JSON en C, más rápido que json
+except ImportError:  # pragma: no cover
+    orjson = None
+
+import llm_cache
+
+# pandas, PyMuPDF y EasyOCR (torch) se importan bajo demanda, dentro de las funciones
+# que los usan: /health y /upload no pagan su carga (cold start más rápido)
+if TYPE_CHECKING:
+    import fitz  # PyMuPDF
+    import pandas as pd
+
+
+# =========================
+# 🔤 Regex precompiladas (se compilan una vez al importar)
+# =========================
+_RE_FENCE_INI = re.compile(r"^```(?:json)?\s*")
+_RE_FENCE_FIN = re.compile(r"\s*```$")
+_RE_COMA_FINAL = re.compile(r",\s*([}\]])")
+_RE_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_RE_DDMONYYYY = re.compile(r"(\d{1,2})[-/ ]([A-Z]{3})[-/ ](\d{4})")
+_RE_DDMMYYYY = re.compile(r"(\d{1,2})[-/](\d{1,2})[-/](\d{4})")
+_RE_DDMMYY_ES = re.compile(r"(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})")
+_RE_FECHA_TEXTO_ES = re.compile(r"(\d{1,2})\s*(?:DE\s*)?([A-ZÁÉÍÓÚÑ]+)\s*(?:DE\s*)?(\d{4})")
+_RE_WS = re.compile(r"[ \t]+")
+_RE_NL = re.compile(r"\n{3,}")
+_RE_CAMPO26 = re.compile(r"26\.\s*Número de Identificación\s*([0-9\s]{6,20})", re.IGNORECASE)
+_RE_CEDULA_CIUDADANIA = re.compile(r"Cédula de Ciudadanía\s*([0-9\s]{6,20})", re.IGNORECASE)
+_RE_CAMPO26_VALIDO = re.compile(r"26\.\s*Número de Identificación\s*[\n: ]+\s*(\d{8,10})")
+_RE_BANCO_NIT = re.compile(r"\bN\.?I\.?T\.?\s*[:\- ]*([0-9\.]{5,15}(?:\-[0-9])?)", re.IGNORECASE)
+# No. Cuenta / Cuenta de Inversión / Cuenta: una sola alternancia (un solo recorrido)
+_RE_CUENTA = re.compile(
+    r"\b(?:N[°o]?\.?\s*CUENTA|CUENTA\s+DE\s+INVERSI[ÓO]N|CUENTA)\s*[:\- ]*([0-9\- ]{6,30})",
+    re.IGNORECASE,
+)
 
 
 # =========================
@@ -51,16 +88,57 @@ def agregar_log(logs: list, documento: str, tipo: str, mensaje: str):
 # =========================
 # 💾 Utilidades generales
 # =========================
-def safe_json_loads(raw: str) -> dict:
-    raw = (raw or "").strip()
-    raw = re.sub(r"^```(?:json)?\s*", "", raw)
-    raw = re.sub(r"\s*```$", "", raw)
+def _json_loads(raw: str):
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # orjson es estricto (NaN, etc.): json estándar decide
     return json.loads(raw)
 
+
+def safe_json_loads(raw: str) -> dict:
+    """
+    Parsea la respuesta del LLM. Camino rápido sin regex (JSON limpio o vallas ```json
+    en su propia línea, vía orjson); las regex solo se usan como último recurso
+    (vallas pegadas al texto, comas finales antes de } o ]).
+    """
+    original = (raw or "").strip()
+    raw = original
+    if raw.startswith("```"):
+        raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
+        raw = raw.rstrip()
+        if raw.endswith("```"):
+            raw = raw[:-3]
+    try:
+        return _json_loads(raw)
+    except json.JSONDecodeError:
+        raw = _RE_FENCE_INI.sub("", original)
+        raw = _RE_FENCE_FIN.sub("", raw)
+        try:
+            return _json_loads(raw)
+        except json.JSONDecodeError:
+            return _json_loads(_RE_COMA_FINAL.sub(r"\1", raw))
+
+
+class _TablaDigitos(dict):
+    """
+    Tabla para str.translate que deja solo dígitos (mismo criterio que \\d).
+    Se llena bajo demanda, un code point a la vez.
+    """
+    def __missing__(self, cp: int):
+        v = cp if chr(cp).isdecimal() else None
+        self[cp] = v
+        return v
+
+
+_KEEP_DIGITS = _TablaDigitos()
+
+
 def only_digits(x: str | None) -> str | None:
     if x is None:
         return None
-    d = re.sub(r"\D", "", str(x))
+    d = str(x).translate(_KEEP_DIGITS)
     return d if d else None
 
 def normalize_text(x: str | None) -> str | None:
@@ -69,6 +147,19 @@ def normalize_text(x: str | None) -> str | None:
     x = str(x).strip()
     return x if x else None
 
+
+# Tablas de meses (constantes: no se reconstruyen en cada llamada)
+_MONTHS_EN = {
+    "JAN": 1, "FEB": 2, "MAR": 3, "APR": 4, "MAY": 5, "JUN": 6,
+    "JUL": 7, "AUG": 8, "SEP": 9, "OCT": 10, "NOV": 11, "DEC": 12
+}
+_MONTHS_ES = {
+    "ENERO":1, "FEBRERO":2, "MARZO":3, "ABRIL":4, "MAYO":5, "JUNIO":6,
+    "JULIO":7, "AGOSTO":8, "SEPTIEMBRE":9, "SETIEMBRE":9, "OCTUBRE":10,
+    "NOVIEMBRE":11, "DICIEMBRE":12
+}
+
+
 def normalize_date(x: str | None) -> str | None:
     """
     Deja fechas como texto, pero intenta normalizar un poco.
@@ -79,24 +170,20 @@ def normalize_date(x: str | None) -> str | None:
     x = str(x).strip().upper()
 
     # Si ya viene ISO-ish
-    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", x):
+    if _RE_ISO_DATE.fullmatch(x):
         return x
 
     # dd-MMM-yyyy
-    m = re.search(r"(\d{1,2})[-/ ]([A-Z]{3})[-/ ](\d{4})", x)
+    m = _RE_DDMONYYYY.search(x)
     if m:
         dd = int(m.group(1))
         mon = m.group(2)
         yyyy = int(m.group(3))
-        months = {
-            "JAN": 1, "FEB": 2, "MAR": 3, "APR": 4, "MAY": 5, "JUN": 6,
-            "JUL": 7, "AUG": 8, "SEP": 9, "OCT": 10, "NOV": 11, "DEC": 12
-        }
-        if mon in months:
-            return f"{yyyy:04d}-{months[mon]:02d}-{dd:02d}"
+        if mon in _MONTHS_EN:
+            return f"{yyyy:04d}-{_MONTHS_EN[mon]:02d}-{dd:02d}"
 
     # dd-mm-yyyy
-    m = re.search(r"(\d{1,2})[-/](\d{1,2})[-/](\d{4})", x)
+    m = _RE_DDMMYYYY.search(x)
     if m:
         dd = int(m.group(1))
         mm = int(m.group(2))
@@ -106,6 +193,28 @@ def normalize_date(x: str | None) -> str | None:
     return x  # fallback
 
 
+class _TablaControl(dict):
+    """
+    Tabla para str.translate que elimina caracteres de control (categoría C*),
+    excepto salto de línea y tab. Se llena bajo demanda: cada code point se
+    clasifica una sola vez por proceso (precalcular los 1.1M sería muy costoso).
+    """
+    def __missing__(self, cp: int):
+        ch = chr(cp)
+        v = None if (unicodedata.category(ch).startswith("C") and ch not in "\n\t") else cp
+        self[cp] = v
+        return v
+
+
+# Espacios raros: se resuelven en el mismo pase de translate que los de control
+_CTRL_TABLE = _TablaControl({
+    0x00A0: " ",   # non-breaking space
+    0x200B: None,  # zero-width space
+    0x200E: None,  # LRM
+    0x200F: None,  # RLM
+})
+
+
 def limpiar_texto_para_llm(text: str) -> str:
     """
     Limpia texto extraído de PDF para evitar UnicodeEncodeError:
@@ -116,28 +225,17 @@ def limpiar_texto_para_llm(text: str) -> str:
     if not text:
         return ""
 
-    # Normaliza (quita rarezas tipo ligaduras)
-    t = unicodedata.normalize("NFKC", text)
+    # Normaliza (quita rarezas tipo ligaduras); la verificación en C evita
+    # copiar el texto cuando ya está normalizado (caso común en PDFs con texto)
+    t = text if unicodedata.is_normalized("NFKC", text) else unicodedata.normalize("NFKC", text)
 
-    # Reemplazar espacios raros
-    t = t.replace("\u00A0", " ")  # non-breaking space
-    t = t.replace("\u200B", "")   # zero-width space
-    t = t.replace("\u200E", "")   # LRM
-    t = t.replace("\u200F", "")   # RLM
-
-    # Eliminar caracteres de control (excepto saltos de línea y tab)
-    cleaned = []
-    for ch in t:
-        cat = unicodedata.category(ch)
-        if cat.startswith("C") and ch not in ["\n", "\t"]:
-            continue
-        cleaned.append(ch)
-
-    t = "".join(cleaned)
+    # Reemplazar espacios raros + eliminar caracteres de control
+    # (excepto saltos de línea y tab) en un solo pase
+    t = t.translate(_CTRL_TABLE)
 
     # Compactar espacios
-    t = re.sub(r"[ \t]+", " ", t)
-    t = re.sub(r"\n{3,}", "\n\n", t)
+    t = _RE_WS.sub(" ", t)
+    t = _RE_NL.sub("\n\n", t)
 
     return t.strip()
 
@@ -145,31 +243,153 @@ def limpiar_texto_para_llm(text: str) -> str:
 # =========================
 # ✅ Mejora RUT: anti-código-de-barras (numero_identificacion)
 # =========================
+# OCR_DEVICE=cpu|cuda|auto (auto: GPU si torch detecta CUDA)
+OCR_DEVICE = os.getenv("OCR_DEVICE", "auto").strip().lower()
+_OCR_FORZAR_CPU = False
+
+
+def _ocr_usar_gpu() -> bool:
+    if _OCR_FORZAR_CPU or OCR_DEVICE == "cpu":
+        return False
+    try:
+        import torch
+    except Exception:
+        return False
+    return bool(torch.cuda.is_available())
+
+
+def _es_cuda_oom(e: Exception) -> bool:
+    return "out of memory" in str(e).lower()
+
+
+# lru_cache no evita que dos hilos construyan el Reader a la vez (carga de pesos duplicada):
+# la creación va bajo lock; la inferencia posterior sí puede correr en paralelo
+_OCR_READER_LOCK = threading.Lock()
+
+
 @lru_cache(maxsize=1)
-def get_easyocr_reader():
+def _crear_easyocr_reader():
+    import easyocr
+    if _ocr_usar_gpu():
+        try:
+            return easyocr.Reader(["es"], gpu=True, cudnn_benchmark=True)
+        except RuntimeError:
+            # CUDA OOM / driver roto al cargar pesos -> seguimos en CPU
+            pass
     return easyocr.Reader(["es"], gpu=False)
 
+
+def get_easyocr_reader():
+    """Carga EasyOCR una sola vez por proceso (GPU si está disponible, si no CPU)."""
+    with _OCR_READER_LOCK:
+        return _crear_easyocr_reader()
+
 # alias por compatibilidad
 get_ocr_reader = get_easyocr_reader
 
 
-def ocr_numero_identificacion_desde_campo26(pdf_bytes: bytes) -> str | None:
+def _ocr_llamar(metodo: str, *args, **kwargs):
+    """
+    Llama reader.<metodo> con fallback a CPU: si la GPU se queda sin memoria,
+    reconstruye el reader con gpu=False y reintenta una vez.
+    """
+    global _OCR_FORZAR_CPU
+    reader = get_easyocr_reader()
+    try:
+        return getattr(reader, metodo)(*args, **kwargs)
+    except RuntimeError as e:
+        if getattr(reader, "device", "cpu") == "cpu" or not _es_cuda_oom(e):
+            raise
+        _OCR_FORZAR_CPU = True
+        with _OCR_READER_LOCK:
+            _crear_easyocr_reader.cache_clear()
+        return getattr(get_easyocr_reader(), metodo)(*args, **kwargs)
+
+
+def ocr_readtext(img, **kwargs) -> list:
+    return _ocr_llamar("readtext", img, **kwargs)
+
+
+def ocr_readtext_batched(imgs: list, **kwargs) -> list[list]:
+    return _ocr_llamar("readtext_batched", imgs, **kwargs)
+
+
+def warmup_ocr() -> None:
+    """
+    Carga los pesos de EasyOCR y hace inferencias de prueba al arrancar el proceso,
+    para que la primera request no pague el cold start.
+    En GPU se calienta con la forma real del lote (cuDNN benchmark fija sus kernels).
+    """
+    reader = get_easyocr_reader()
+    ocr_readtext(np.zeros((64, 64, 3), dtype=np.uint8), detail=0)
+    if getattr(reader, "device", "cpu") != "cpu":
+        dummy = np.zeros((OCR_BATCH_HEIGHT, OCR_BATCH_WIDTH, 3), dtype=np.uint8)
+        for _ in range(2):
+            ocr_readtext_batched(
+                [dummy, dummy],
+                n_width=OCR_BATCH_WIDTH,
+                n_height=OCR_BATCH_HEIGHT,
+                detail=0,
+            )
+
+
+# PyMuPDF no es thread-safe: toda llamada a fitz va bajo este lock
+# (los documentos se procesan en hilos en paralelo; el OCR sí corre sin lock)
+_FITZ_LOCK = threading.RLock()
+
+
+def _open_doc(pdf: bytes | str) -> fitz.Document:
+    """
+    bytes -> documento en memoria.
+    str (path) -> PyMuPDF lee el archivo directamente (sin copia completa a bytes de Python).
+    """
+    import fitz  # PyMuPDF
+    with _FITZ_LOCK:
+        if isinstance(pdf, str):
+            return fitz.open(pdf)
+        return fitz.open(stream=pdf, filetype="pdf")
+
+
+@contextmanager
+def _pdf_doc(pdf_bytes: bytes | str | None, doc: fitz.Document | None = None):
+    """Reusa `doc` si ya viene abierto; si no, abre pdf_bytes (o un path) y lo cierra al salir."""
+    if doc is not None:
+        yield doc
+        return
+    opened = _open_doc(pdf_bytes)
+    try:
+        yield opened
+    finally:
+        with _FITZ_LOCK:
+            opened.close()
+
+
+def ocr_numero_identificacion_desde_campo26(pdf_bytes: bytes | None, doc: fitz.Document | None = None) -> str | None:
     """
     Busca en el PDF el texto 'Número de Identificación' y hace OCR SOLO en un recorte
     cerca de ese campo para capturar la cédula correcta (8-10 dígitos).
     """
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    reader = get_easyocr_reader()
+    with _pdf_doc(pdf_bytes, doc) as doc:
+        return _ocr_campo26(doc)
+
 
+def _recorte_campo26(doc: fitz.Document, page_no: int) -> tuple[list[str], np.ndarray | None] | None:
+    """
+    Bajo _FITZ_LOCK: busca el campo en la página y devuelve (candidatos de la capa de texto, imagen del
+    recorte). La imagen es una copia propia (no depende del pixmap), para hacer el OCR sin el lock.
+    None si la página no tiene el campo.
+    """
+    import fitz  # PyMuPDF
     targets = ["Número de Identificación", "Numero de Identificacion"]
 
-    for page in doc:
+    with _FITZ_LOCK:
+        page = doc[page_no]
         rects = []
         for t in targets:
             rects += page.search_for(t)
 
         if not rects:
-            continue
+            return None
 
         r = rects[0]
 
@@ -180,28 +400,56 @@ def ocr_numero_identificacion_desde_campo26(pdf_bytes: bytes) -> str | None:
             min(r.y1 + 80, page.rect.y1)
         )
 
-        pix = page.get_pixmap(clip=clip, dpi=300)
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        # 1) RUT digital: la capa de texto del recorte suele traer el número (sin OCR)
+        candidatos = _candidatos_numero_id(page.get_text("text", clip=clip).splitlines())
+        if candidatos:
+            return candidatos, None
+
+        # 2) RUT escaneado: render del recorte
+        # 200 DPI en gris basta para 8-10 dígitos (EasyOCR trabaja en gris igual)
+        pix = page.get_pixmap(clip=clip, dpi=200, colorspace=fitz.csGRAY, alpha=False)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w).copy()
+        return [], img
 
-        results = reader.readtext(np.array(img), detail=0)
 
-        candidatos = []
-        for s in results:
-            dig = re.sub(r"\D", "", s)
-            if 8 <= len(dig) <= 10:
-                candidatos.append(dig)
+def _ocr_campo26(doc: fitz.Document) -> str | None:
+    with _FITZ_LOCK:
+        n_pages = doc.page_count
 
+    for page_no in range(n_pages):
+        recorte = _recorte_campo26(doc, page_no)
+        if recorte is None:
+            continue
+
+        candidatos, img = recorte
+        if candidatos:
+            return candidatos[0]
+
+        # OCR fuera del lock: los demás documentos siguen usando fitz mientras tanto
+        results = ocr_readtext(img, detail=0)
+
+        candidatos = _candidatos_numero_id(results)
         if candidatos:
-            candidatos.sort(key=len, reverse=True)
             return candidatos[0]
 
     return None
 
 
+def _candidatos_numero_id(lineas: list[str]) -> list[str]:
+    """Líneas con 8-10 dígitos, de la más larga a la más corta."""
+    candidatos = []
+    for s in lineas:
+        dig = s.translate(_KEEP_DIGITS)
+        if 8 <= len(dig) <= 10:
+            candidatos.append(dig)
+    candidatos.sort(key=len, reverse=True)
+    return candidatos
+
+
 def numero_id_es_sospechoso(num: str | None) -> bool:
     if not num:
         return True
-    num = re.sub(r"\D", "", str(num))
+    num = str(num).translate(_KEEP_DIGITS)
     if not (8 <= len(num) <= 10):
         return True
     return False
@@ -216,15 +464,15 @@ def extraer_numero_identificacion_regla(texto: str) -> str | None:
     """
     t = " ".join(texto.split())
 
-    m = re.search(r"26\.\s*Número de Identificación\s*([0-9\s]{6,20})", t, re.IGNORECASE)
+    m = _RE_CAMPO26.search(t)
     if m:
-        cand = re.sub(r"\D", "", m.group(1))
+        cand = m.group(1).translate(_KEEP_DIGITS)
         if 6 <= len(cand) <= 11:
             return cand
 
-    m = re.search(r"Cédula de Ciudadanía\s*([0-9\s]{6,20})", t, re.IGNORECASE)
+    m = _RE_CEDULA_CIUDADANIA.search(t)
     if m:
-        cand = re.sub(r"\D", "", m.group(1))
+        cand = m.group(1).translate(_KEEP_DIGITS)
         if 6 <= len(cand) <= 11:
             return cand
 
@@ -248,13 +496,12 @@ def validar_numero_identificacion(texto: str, candidato: str) -> str | None:
     if not candidato:
         return None
 
-    candidato = re.sub(r"\D", "", candidato)
+    candidato = str(candidato).translate(_KEEP_DIGITS)
 
     if not (8 <= len(candidato) <= 10):
         return None
 
-    patron = re.compile(r"26\.\s*Número de Identificación\s*[\n: ]+\s*(\d{8,10})")
-    match = patron.search(texto)
+    match = _RE_CAMPO26_VALIDO.search(texto)
 
     if match:
         return match.group(1)
@@ -265,16 +512,59 @@ def validar_numero_identificacion(texto: str, candidato: str) -> str | None:
 # =========================
 # 📄 Extracción RUT (texto embebido)
 # =========================
-def extract_text_pymupdf(pdf_bytes: bytes) -> str:
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+def extract_text_pymupdf(
+    pdf_bytes: bytes | None,
+    max_chars: int | None = None,
+    flags: int | None = None,
+    doc: fitz.Document | None = None,
+) -> str:
+    """
+    Texto embebido de todas las páginas.
+    max_chars: deja de leer páginas cuando el texto acumulado supera ese largo.
+    """
     parts = []
-    for page in doc:
-        parts.append(page.get_text("text"))
+    total = 0
+    with _pdf_doc(pdf_bytes, doc) as doc, _FITZ_LOCK:
+        for page in doc:
+            txt = page.get_text("text", flags=flags)
+            parts.append(txt)
+            total += len(txt)
+            if max_chars is not None and total > max_chars:
+                break
     return "\n".join(parts).strip()
 
 
-def extract_rut_fields_raw(client: OpenAI, text: str) -> str:
-    prompt = f"""
+LLM_MODEL = "gpt-4o-mini"
+# Subir al cambiar el mensaje de sistema / parámetros de la llamada (invalida el cache LLM)
+LLM_PROMPT_VERSION = "1"
+
+
+async def _chat_json(client: AsyncOpenAI, prompt: str) -> str:
+    """
+    Una llamada de chat que debe devolver JSON (texto crudo).
+    Cacheada por hash del prompt: el mismo texto no se vuelve a enviar a OpenAI.
+    """
+    key = llm_cache.make_key(LLM_MODEL, LLM_PROMPT_VERSION, prompt)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+
+    resp = await client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=[
+            {"role": "system", "content": "Devuelve SOLO JSON válido. Sin markdown."},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0,
+        # El servidor garantiza un objeto JSON parseable (sin ```json ... ```)
+        response_format={"type": "json_object"},
+    )
+    content = resp.choices[0].message.content
+    llm_cache.put(key, content)
+    return content
+
+
+_PROMPT_RUT = """
 Extrae del siguiente texto (RUT DIAN) ÚNICAMENTE estos campos y devuelve SOLO JSON válido:
 - tipo_documento
 - numero_identificacion
@@ -292,15 +582,10 @@ Reglas:
 TEXTO:
 {text}
 """
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "Devuelve SOLO JSON válido. Sin markdown."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0,
-    )
-    return resp.choices[0].message.content
+
+
+async def extract_rut_fields_raw(client: AsyncOpenAI, text: str) -> str:
+    return await _chat_json(client, _PROMPT_RUT.format(text=text))
 
 
 def normalizar_campos_rut(data: dict, rut_texto: str = "") -> dict:
@@ -328,33 +613,70 @@ def normalizar_campos_rut(data: dict, rut_texto: str = "") -> dict:
 # =========================
 # 🪪 Extracción Cédula (PDF imagen -> OCR)
 # =========================
-def pdf_to_images_pymupdf(pdf_bytes: bytes, zoom: float = 2.5) -> list[Image.Image]:
+def pdf_to_images_pymupdf(
+    pdf_bytes: bytes | None,
+    zoom: float = 2.5,
+    doc: fitz.Document | None = None,
+    gris: bool = False,
+) -> list[np.ndarray]:
     """
-    Renderiza páginas PDF a imágenes (sin poppler).
+    Renderiza páginas PDF a arrays RGB (H, W, 3) listos para EasyOCR (sin poppler).
+    Se usan los samples crudos del pixmap: sin pasar por PNG ni PIL.
     zoom 2.5 = más nitidez para OCR.
+    gris=True -> arrays (H, W) en escala de grises: MuPDF convierte al renderizar
+    (1/3 de memoria, sin conversión aparte) y el reconocedor de EasyOCR trabaja en gris igual.
     """
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    import fitz  # PyMuPDF
     images = []
     mat = fitz.Matrix(zoom, zoom)
-    for page in doc:
-        pix = page.get_pixmap(matrix=mat, alpha=False)
-        img = Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGB")
-        images.append(img)
+    cs = fitz.csGRAY if gris else fitz.csRGB
+    with _pdf_doc(pdf_bytes, doc) as doc, _FITZ_LOCK:
+        for page in doc:
+            pix = page.get_pixmap(matrix=mat, alpha=False, colorspace=cs)
+            arr = np.frombuffer(pix.samples, dtype=np.uint8)
+            images.append(arr.reshape(pix.h, pix.w) if gris else arr.reshape(pix.h, pix.w, 3))
     return images
 
 
-def ocr_images_easyocr(images: list[Image.Image]) -> str:
-    reader = get_ocr_reader()
-    all_lines = []
-    for img in images:
-        img_np = np.array(img)
-        lines = reader.readtext(img_np, detail=0)
-        all_lines.extend(lines)
-    return "\n".join([l for l in all_lines if l and str(l).strip()]).strip()
+# Tamaño común para OCR por lotes (todas las páginas deben tener la misma forma)
+OCR_BATCH_WIDTH = 1600
+OCR_BATCH_HEIGHT = 2200
+OCR_BATCH_SIZE = 8
 
 
-def extract_cc_fields_raw(client: OpenAI, ocr_text: str) -> str:
-    prompt = f"""
+def ocr_images_easyocr(images: list[np.ndarray]) -> str:
+    """
+    1 página -> readtext normal.
+    N páginas en GPU -> readtext_batched: un solo pase del detector para todo el lote
+    (EasyOCR redimensiona cada página a n_width x n_height).
+    N páginas en CPU -> pool de hilos (torch libera el GIL durante la inferencia).
+    """
+    if not images:
+        return ""
+    if len(images) == 1:
+        pages = [ocr_readtext(images[0], detail=0)]
+    elif getattr(get_easyocr_reader(), "device", "cpu") == "cpu":
+        workers = min(len(images), max(1, (os.cpu_count() or 2) // 2))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            pages = list(ex.map(lambda img: ocr_readtext(img, detail=0), images))
+    else:
+        pages = ocr_readtext_batched(
+            images,
+            n_width=OCR_BATCH_WIDTH,
+            n_height=OCR_BATCH_HEIGHT,
+            detail=0,
+            batch_size=OCR_BATCH_SIZE,
+        )
+    # readtext(detail=0) ya devuelve str: un solo join sin lista intermedia
+    return "\n".join(
+        line
+        for lines in pages
+        for line in lines
+        if line and line.strip()
+    ).strip()
+
+
+_PROMPT_CC = """
 A partir del texto OCR de una CÉDULA DE CIUDADANÍA de Colombia, extrae SOLO estos campos y devuelve SOLO JSON válido:
 - doc_pais_emisor
 - doc_tipo_documento
@@ -382,17 +704,12 @@ Reglas:
 - Devuelve únicamente JSON, sin explicación, sin markdown.
 
 TEXTO_OCR:
-{ocr_text}
+{text}
 """
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "Devuelve SOLO JSON válido. Sin markdown."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0,
-    )
-    return resp.choices[0].message.content
+
+
+async def extract_cc_fields_raw(client: AsyncOpenAI, ocr_text: str) -> str:
+    return await _chat_json(client, _PROMPT_CC.format(text=ocr_text))
 
 
 def normalizar_campos_cc(data: dict) -> dict:
@@ -438,26 +755,21 @@ def normalize_date_es(x: str | None) -> str | None:
     s_norm = unicodedata.normalize("NFKC", s).upper()
 
     # ISO ya
-    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", s_norm):
+    if _RE_ISO_DATE.fullmatch(s_norm):
         return s_norm
 
     # dd/mm/yyyy o dd-mm-yyyy
-    m = re.search(r"(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})", s_norm)
+    m = _RE_DDMMYY_ES.search(s_norm)
     if m:
         dd = int(m.group(1)); mm = int(m.group(2)); yyyy = int(m.group(3))
         if yyyy < 100:
             yyyy += 2000
         return f"{yyyy:04d}-{mm:02d}-{dd:02d}"
 
-    months = {
-        "ENERO":1, "FEBRERO":2, "MARZO":3, "ABRIL":4, "MAYO":5, "JUNIO":6,
-        "JULIO":7, "AGOSTO":8, "SEPTIEMBRE":9, "SETIEMBRE":9, "OCTUBRE":10,
-        "NOVIEMBRE":11, "DICIEMBRE":12
-    }
     # "5 de febrero de 2026" / "05 FEBRERO 2026"
-    m = re.search(r"(\d{1,2})\s*(?:DE\s*)?([A-ZÁÉÍÓÚÑ]+)\s*(?:DE\s*)?(\d{4})", s_norm)
-    if m and m.group(2) in months:
-        dd = int(m.group(1)); mm = months[m.group(2)]; yyyy = int(m.group(3))
+    m = _RE_FECHA_TEXTO_ES.search(s_norm)
+    if m and m.group(2) in _MONTHS_ES:
+        dd = int(m.group(1)); mm = _MONTHS_ES[m.group(2)]; yyyy = int(m.group(3))
         return f"{yyyy:04d}-{mm:02d}-{dd:02d}"
 
     return s.strip()
@@ -465,7 +777,7 @@ def normalize_date_es(x: str | None) -> str | None:
 
 def extraer_banco_nit_regla(texto: str) -> str | None:
     # NIT 800.244.627-7 / N.I.T. 800.244.627
-    m = re.search(r"\bN\.?I\.?T\.?\s*[:\- ]*([0-9\.]{5,15}(?:\-[0-9])?)", texto, re.IGNORECASE)
+    m = _RE_BANCO_NIT.search(texto)
     if not m:
         return None
     return m.group(1).strip()
@@ -473,17 +785,29 @@ def extraer_banco_nit_regla(texto: str) -> str | None:
 
 def extraer_numero_cuenta_regla(texto: str) -> str | None:
     # Cuenta / No. Cuenta / Cuenta de Inversión
-    patterns = [
-        r"\bN[°o]?\.?\s*CUENTA\s*[:\- ]*([0-9\- ]{6,30})",
-        r"\bCUENTA\s*[:\- ]*([0-9\- ]{6,30})",
-        r"\bCUENTA\s+DE\s+INVERSI[ÓO]N\s*[:\- ]*([0-9\- ]{6,30})",
-    ]
-    for pat in patterns:
-        m = re.search(pat, texto, re.IGNORECASE)
-        if m:
-            cand = re.sub(r"\D", "", m.group(1))
-            if 6 <= len(cand) <= 30:
-                return cand
+    for m in _RE_CUENTA.finditer(texto):
+        cand = m.group(1).translate(_KEEP_DIGITS)
+        if 6 <= len(cand) <= 30:
+            return cand
+    return None
+
+
+# Marca en el texto -> nombre normalizado (el orden define la prioridad)
+BANCOS_CONOCIDOS = {
+    "BANCOLOMBIA": "Bancolombia",
+    "DAVIVIENDA": "Davivienda",
+    "SCOTIABANK": "Scotiabank Colpatria",
+    "COLPATRIA": "Scotiabank Colpatria",
+}
+_RE_BANCOS = re.compile("|".join(map(re.escape, BANCOS_CONOCIDOS)), re.IGNORECASE)
+
+
+def extraer_banco_nombre_regla(texto: str) -> str | None:
+    # Un solo recorrido del texto sin importar cuántos bancos haya en la tabla
+    encontrados = {m.group(0).upper() for m in _RE_BANCOS.finditer(texto or "")}
+    for marca, nombre in BANCOS_CONOCIDOS.items():
+        if marca in encontrados:
+            return nombre
     return None
 
 
@@ -496,8 +820,7 @@ def extraer_estado_cuenta_regla(texto: str) -> str | None:
     return None
 
 
-def extract_doc16_fields_raw(client: OpenAI, text: str) -> str:
-    prompt = f"""
+_PROMPT_DOC16 = """
 A partir del texto de una CERTIFICACIÓN BANCARIA (Colombia), extrae SOLO estos campos y devuelve SOLO JSON válido:
 - doc_tipo
 - banco_nombre
@@ -523,15 +846,10 @@ REGLAS:
 TEXTO:
 {text}
 """
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "Devuelve SOLO JSON válido. Sin markdown."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0,
-    )
-    return resp.choices[0].message.content
+
+
+async def extract_doc16_fields_raw(client: AsyncOpenAI, text: str) -> str:
+    return await _chat_json(client, _PROMPT_DOC16.format(text=text))
 
 
 def normalizar_campos_doc16(data: dict, texto: str = "") -> dict:
@@ -568,30 +886,85 @@ def normalizar_campos_doc16(data: dict, texto: str = "") -> dict:
 
     # Banco nombre: fallback simple por marcas conocidas (evita inventar)
     if not data.get("banco_nombre"):
-        t = texto.upper()
-        if "BANCOLOMBIA" in t:
-            data["banco_nombre"] = "Bancolombia"
-        elif "DAVIVIENDA" in t:
-            data["banco_nombre"] = "Davivienda"
-        elif "SCOTIABANK" in t or "COLPATRIA" in t:
-            data["banco_nombre"] = "Scotiabank Colpatria"
+        banco = extraer_banco_nombre_regla(texto)
+        if banco:
+            data["banco_nombre"] = banco
 
     return data
 
 
-def extract_doc16_text(pdf_bytes: bytes) -> str:
-    """Primero intenta texto embebido; si no, OCR a imagen con EasyOCR."""
-    text = extract_text_pymupdf(pdf_bytes)
-    text = limpiar_texto_para_llm(text)
-    if len(text) >= 120:
-        return text
+DOC16_MIN_CHARS_TEXTO = 120
+DOC16_MAX_CHARS_TEXTO = 2000
+
 
-    # OCR fallback (1-2 páginas típicamente)
-    images = pdf_to_images_pymupdf(pdf_bytes, zoom=2.5)
+def extract_doc16_text(pdf_bytes: bytes | None, doc: fitz.Document | None = None) -> str:
+    """Primero intenta texto embebido; si no, OCR a imagen con EasyOCR."""
+    import fitz  # PyMuPDF
+    with _pdf_doc(pdf_bytes, doc) as doc:
+        text = extract_text_pymupdf(
+            None,
+            max_chars=DOC16_MAX_CHARS_TEXTO,
+            flags=fitz.TEXTFLAGS_TEXT | fitz.TEXT_DEHYPHENATE,
+            doc=doc,
+        )
+        # Solo se limpia si el texto crudo ya alcanza el mínimo (si no, va directo a OCR)
+        if len(text) >= DOC16_MIN_CHARS_TEXTO:
+            text = limpiar_texto_para_llm(text)
+            if len(text) >= DOC16_MIN_CHARS_TEXTO:
+                return text
+
+        # OCR fallback (1-2 páginas típicamente)
+        images = pdf_to_images_pymupdf(None, zoom=2.5, doc=doc, gris=True)
     ocr_text = ocr_images_easyocr(images)
     return limpiar_texto_para_llm(ocr_text)
 
 
+# =========================
+# 🧩 IA en lote: RUT / Cédula / DOC16 en una sola llamada (2 o más documentos)
+# =========================
+_PROMPT_LOTE = """
+Vas a recibir {n} documentos del mismo caso, cada uno en su sección delimitada por <<<CLAVE>>>.
+Aplica a cada sección SOLO sus instrucciones y devuelve SOLO un JSON válido con exactamente
+estas claves de primer nivel (un objeto con los campos de cada sección):
+{claves}
+Sin explicación, sin markdown.
+{secciones}
+"""
+
+# clave de salida -> (marcador, plantilla del documento)
+_SECCIONES_LOTE = {
+    "rut": ("<<<RUT>>>", _PROMPT_RUT),
+    "cc": ("<<<CC>>>", _PROMPT_CC),
+    "doc16": ("<<<DOC16>>>", _PROMPT_DOC16),
+}
+
+
+async def extract_all_fields_raw(
+    client: AsyncOpenAI,
+    rut_text: str | None = None,
+    cc_text: str | None = None,
+    doc16_text: str | None = None,
+) -> dict:
+    """
+    Un solo round-trip al LLM para los documentos presentes (None = documento ausente).
+    Retorna {"rut": {...}, "cc": {...}, "doc16": {...}} (ya parseado). Solo trae las claves que
+    el modelo devolvió como objeto: las que falten se extraen aparte, documento por documento.
+    """
+    textos = {"rut": rut_text, "cc": cc_text, "doc16": doc16_text}
+    claves = [k for k, t in textos.items() if t is not None]
+    prompt = _PROMPT_LOTE.format(
+        n=len(claves),
+        claves="\n".join(f'- "{k}"' for k in claves),
+        secciones="".join(
+            f"\n{_SECCIONES_LOTE[k][0]}\n{_SECCIONES_LOTE[k][1].format(text=textos[k])}" for k in claves
+        ),
+    )
+    data = safe_json_loads(await _chat_json(client, prompt))
+    if not isinstance(data, dict):
+        return {}
+    return {k: data[k] for k in claves if isinstance(data.get(k), dict)}
+
+
 # =========================
 # ✅ Validaciones
 # =========================
@@ -744,73 +1117,93 @@ MASTER_ROWS = [
      "Nombre de la Variable": "ciudad_expedicion", "Tipo_Variable": "texto", "Caracterización": "Ciudad (si está indicada)"},
 ]
 
+# Índices por doc_id (una sola pasada al importar; evita recorrer MASTER_ROWS por documento)
+MASTER_BY_DOC: Dict[str, List[dict]] = {}
+for _r in MASTER_ROWS:
+    MASTER_BY_DOC.setdefault(_r["doc_id"], []).append(_r)
+MASTER_FIELDS_BY_DOC: Dict[str, List[str]] = {
+    k: [r["Nombre de la Variable"] for r in v] for k, v in MASTER_BY_DOC.items()
+}
+del _r
+
 
 # =========================
 # 📊 Métricas mínimas (tiempo / completitud / warnings)
 # =========================
 def campos_esperados_por_doc(doc_id: str) -> list[str]:
-    """Devuelve los campos esperados según el diccionario maestro."""
-    return [r["Nombre de la Variable"] for r in MASTER_ROWS if r["doc_id"] == doc_id]
+    """Devuelve los campos esperados según el diccionario maestro (no modificar la lista)."""
+    return MASTER_FIELDS_BY_DOC.get(doc_id, [])
 
 def calcular_completitud(data: dict | None, campos_esperados: list[str]) -> float | None:
     """% de campos esperados con valor no vacío (None/'' se considera vacío)."""
     if not data or not campos_esperados:
         return None
-    llenos = 0
-    for k in campos_esperados:
-        v = data.get(k)
-        if v is None:
-            continue
-        if isinstance(v, str) and v.strip() == "":
-            continue
-        llenos += 1
-    return round(100 * llenos / len(campos_esperados), 1)
+    total = len(campos_esperados)
+    # "vacío" = None, "" o solo espacios; isspace() no copia el string como strip()
+    llenos = sum(
+        1
+        for k in campos_esperados
+        if (v := data.get(k)) is not None and not (isinstance(v, str) and (not v or v.isspace()))
+    )
+    return round(100 * llenos / total, 1)
 
 def contar_warnings(logs: list, documento: str) -> int:
     return sum(1 for l in (logs or []) if l.get("tipo") == "WARNING" and l.get("documento") == documento)
 
 
-def fill_master_values(rut_data: dict | None, cc_data: dict | None, doc16_data: dict | None) -> pd.DataFrame:
-    rows = [r.copy() for r in MASTER_ROWS]
-
-    # RUT
+def _datos_por_doc(rut_data: dict | None, cc_data: dict | None, doc16_data: dict | None) -> Dict[str, dict]:
+    """doc_id -> datos extraídos, con los valores fijos del diccionario ya aplicados."""
+    datos: Dict[str, dict] = {}
     if rut_data:
-        for r in rows:
-            if r["doc_id"] == "DOC14":
-                key = r["Nombre de la Variable"]
-                r["Valor"] = rut_data.get(key)
+        datos["DOC14"] = rut_data
 
-    # Cédula
+    # Cédula: valores fijos del diccionario
     if cc_data:
         cc_data = cc_data.copy()
         cc_data.setdefault("doc_pais_emisor", "República de Colombia")
         cc_data.setdefault("doc_tipo_documento", "Cédula de ciudadanía")
+        cc_data["doc_tipo"] = "Documento de identidad (Cédula de ciudadanía) – imagen anverso/reverso"
+        datos["DOC12"] = cc_data
 
-        for r in rows:
-            if r["doc_id"] == "DOC12":
-                key = r["Nombre de la Variable"]
-                if key == "doc_tipo":
-                    r["Valor"] = "Documento de identidad (Cédula de ciudadanía) – imagen anverso/reverso"
-                else:
-                    r["Valor"] = cc_data.get(key)
-
-    # DOC16 - Certificación bancaria
+    # DOC16: valor fijo del diccionario (evita que el LLM invente)
     if doc16_data:
-        for r in rows:
-            if r["doc_id"] == "DOC16":
-                key = r["Nombre de la Variable"]
-                if key == "doc_tipo":
-                    # Valor fijo del diccionario (evita que el LLM invente)
-                    r["Valor"] = "Certificación bancaria"
-                else:
-                    r["Valor"] = doc16_data.get(key)
+        datos["DOC16"] = {**doc16_data, "doc_tipo": "Certificación bancaria"}
+
+    return datos
+
+
+def fill_master_records(rut_data: dict | None, cc_data: dict | None, doc16_data: dict | None) -> List[dict]:
+    """Consolidado como lista de filas (lo que viaja en el JSON), sin pasar por pandas."""
+    datos = _datos_por_doc(rut_data, cc_data, doc16_data)
+    vacio: dict = {}
+    return [
+        {**r, "Valor": datos.get(r["doc_id"], vacio).get(r["Nombre de la Variable"])}
+        for r in MASTER_ROWS
+    ]
 
-    return pd.DataFrame(rows)
+
+def records_to_excel_bytes(records: List[dict]) -> bytes:
+    """El DataFrame se arma solo aquí, para escribir el Excel."""
+    import pandas as pd
+    return dataframe_to_excel_bytes(pd.DataFrame(records))
 
 
 def dataframe_to_excel_bytes(df: pd.DataFrame) -> bytes:
+    """
+    xlsxwriter en constant_memory escribe fila a fila (sin árbol de objetos como openpyxl).
+    Si xlsxwriter no está instalado, se usa openpyxl.
+    """
+    import pandas as pd
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+    if importlib.util.find_spec("xlsxwriter") is not None:
+        writer = pd.ExcelWriter(
+            output,
+            engine="xlsxwriter",
+            engine_kwargs={"options": {"constant_memory": True, "strings_to_urls": False}},
+        )
+    else:
+        writer = pd.ExcelWriter(output, engine="openpyxl")
+    with writer:
         df.to_excel(writer, index=False, sheet_name="extraccion")
     return output.getvalue()
 
@@ -818,27 +1211,50 @@ def dataframe_to_excel_bytes(df: pd.DataFrame) -> bytes:
 # =========================
 # 🔎 Clasificación mínima por nombre (para N archivos)
 # =========================
+# Palabras clave por documento, en orden de prioridad (el primero que coincide gana).
+# Sin claves redundantes: "CED" ya cubre "CEDULA" y "DOCU" cubre "DOCUMENTOIDENTIFICACION".
+_DOC_ID_KEYWORDS = (
+    ("DOC14", ("RUT", "DOC14")),
+    ("DOC12", ("CED", "DOC12", "DOCU")),
+    ("DOC16", ("CERTIFICACION", "BANCARIA", "DOC16")),
+)
+
+
 def guess_doc_id_by_filename(filename: str) -> Optional[str]:
     """
     MVP: clasifica por nombre para DOC14/DOC12/DOC16.
-    Para los 28, aquí irás sumando reglas o migras a clasificador IA.
+    Para los 28, aquí irás sumando reglas (en _DOC_ID_KEYWORDS) o migras a clasificador IA.
     """
     f = (filename or "").upper()
-    if "RUT" in f or "DOC14" in f:
-        return "DOC14"
-    if "CED" in f or "CEDULA" in f or "DOC12" in f or "DOCUMENTOIDENTIFICACION" in f or "DOCU" in f:
-        return "DOC12"
-    if "CERTIFICACION" in f or "BANCARIA" in f or "DOC16" in f:
-        return "DOC16"
+    for doc_id, claves in _DOC_ID_KEYWORDS:
+        if any(k in f for k in claves):
+            return doc_id
     return None
 
 
+# Nombre de cada documento en los logs
+_DOC_LOG = {"RUT": "RUT", "CEDULA": "CEDULA", "DOC16": "CERTIFICACION_BANCARIA"}
+
+
+def _quitar_fallidos(logs: list, nombres: List[str], resultados: list, contexto: str) -> List[str]:
+    """Registra como ERROR los documentos cuya tarea falló y devuelve solo los que siguen."""
+    ok = []
+    for nombre, r in zip(nombres, resultados):
+        if isinstance(r, Exception):
+            agregar_log(logs, _DOC_LOG[nombre], "ERROR", f"{contexto}: {r}")
+        else:
+            ok.append(nombre)
+    return ok
+
+
 # =========================
 # ✅ Pipeline principal (sin UI) — equivalente a tu botón "Procesar todo"
 # =========================
-def run_pipeline(items: List[DocItem], client: OpenAI) -> Dict[str, Any]:
+async def run_pipeline(items: List[DocItem], client: AsyncOpenAI) -> Dict[str, Any]:
     """
     Procesa N documentos (por ahora implementa DOC14/DOC12/DOC16).
+    RUT, Cédula y DOC16 son independientes: se procesan en paralelo con asyncio.gather
+    (PyMuPDF/EasyOCR en hilos vía asyncio.to_thread, LLM con AsyncOpenAI).
     Retorna:
       - rut_data, cc_data, doc16_data
       - df_master (records)
@@ -851,7 +1267,9 @@ def run_pipeline(items: List[DocItem], client: OpenAI) -> Dict[str, Any]:
     cc_data = None
     doc16_data = None
     rut_texto = ""
+    cc_ocr_text = ""
     doc16_texto = ""
+    rut_doc = None
 
     logs = inicializar_logs()
 
@@ -871,98 +1289,156 @@ def run_pipeline(items: List[DocItem], client: OpenAI) -> Dict[str, Any]:
         else:
             buckets[doc_id].append(it)
 
-    # 2) DOC14 (RUT) — si llegan varios, tomamos el primero (MVP)
-    if buckets["DOC14"]:
-        it = buckets["DOC14"][0]
-        t0_rut = time.perf_counter()
-        rut_bytes = open(it.path, "rb").read()
-
-        rut_texto = extract_text_pymupdf(rut_bytes)
-        rut_texto = limpiar_texto_para_llm(rut_texto)
-        if len(rut_texto) < 100:
-            # En tu app solo advertías; acá dejamos el texto vacío y la IA extrae lo que pueda
-            rut_texto = ""
-
-        raw = extract_rut_fields_raw(client, rut_texto)
-        rut_data = normalizar_campos_rut(safe_json_loads(raw), rut_texto=rut_texto)
-
-        # Fallback OCR SOLO para numero_identificacion (campo 26)
-        id_ocr = None
-        rut_num = rut_data.get("numero_identificacion")
-
-        if numero_id_es_sospechoso(rut_num):
-            id_ocr = ocr_numero_identificacion_desde_campo26(rut_bytes)
-            if id_ocr:
-                rut_data["numero_identificacion"] = id_ocr
-                rut_data["_fuente_numero_identificacion"] = "ocr_campo26"
-
-        if not id_ocr:
-            numero_validado = validar_numero_identificacion(rut_texto, rut_data.get("numero_identificacion"))
-            if numero_validado:
-                rut_data["numero_identificacion"] = numero_validado
-                rut_data["_fuente_numero_identificacion"] = "validado_campo26"
+    # Si llegan varios del mismo tipo, tomamos el primero (MVP)
+    rut_it = buckets["DOC14"][0] if buckets["DOC14"] else None
+    cc_it = buckets["DOC12"][0] if buckets["DOC12"] else None
+    doc16_it = buckets["DOC16"][0] if buckets["DOC16"] else None
+    tiempos: Dict[str, float] = {}
+
+    with ExitStack() as stack:
+        # 2) Texto de cada documento (en hilos: no bloquea el event loop)
+        def _texto_rut():
+            nonlocal rut_doc, rut_texto
+            t0 = time.perf_counter()
+
+            # Un solo parseo del PDF (abierto por path) para texto embebido + OCR del campo 26
+            rut_doc = stack.enter_context(_pdf_doc(rut_it.path))
+            rut_texto = extract_text_pymupdf(None, doc=rut_doc)
+            rut_texto = limpiar_texto_para_llm(rut_texto)
+            if len(rut_texto) < 100:
+                # En tu app solo advertías; acá dejamos el texto vacío y la IA extrae lo que pueda
+                rut_texto = ""
+            tiempos["RUT"] = time.perf_counter() - t0
+
+        def _texto_cc():
+            nonlocal cc_ocr_text
+            t0 = time.perf_counter()
+            with _pdf_doc(cc_it.path) as cc_doc:
+                images = pdf_to_images_pymupdf(None, zoom=2.5, doc=cc_doc, gris=True)
+            cc_ocr_text = ocr_images_easyocr(images)
+            cc_ocr_text = limpiar_texto_para_llm(cc_ocr_text)
+            tiempos["CEDULA"] = time.perf_counter() - t0
+
+        def _texto_doc16():
+            nonlocal doc16_texto
+            t0 = time.perf_counter()
+            with _pdf_doc(doc16_it.path) as doc16_doc:
+                doc16_texto = extract_doc16_text(None, doc=doc16_doc)
+            tiempos["DOC16"] = time.perf_counter() - t0
+
+        activos = [
+            nombre for nombre, it in (("RUT", rut_it), ("CEDULA", cc_it), ("DOC16", doc16_it)) if it
+        ]
+        fases_texto = {"RUT": _texto_rut, "CEDULA": _texto_cc, "DOC16": _texto_doc16}
+        res = await asyncio.gather(
+            *(asyncio.to_thread(fases_texto[n]) for n in activos), return_exceptions=True
+        )
+        activos = _quitar_fallidos(logs, activos, res, "Error extrayendo texto")
+
+        # 3) IA: con 2 o más documentos, una sola llamada (si no, una por documento)
+        #    Si la llamada conjunta falla (timeout, JSON inválido...), cada documento cae a su
+        #    propia llamada: un error del lote no tumba el caso completo
+        lote: Dict[str, dict] = {}
+        if len(activos) >= 2:
+            t0_lote = time.perf_counter()
+            try:
+                lote = await extract_all_fields_raw(
+                    client,
+                    rut_texto if "RUT" in activos else None,
+                    cc_ocr_text if "CEDULA" in activos else None,
+                    doc16_texto if "DOC16" in activos else None,
+                )
+            except Exception as e:
+                agregar_log(
+                    logs, "PIPELINE", "WARNING",
+                    f"Falló la extracción IA conjunta ({e}); se extrae documento por documento.",
+                )
+            t_lote = time.perf_counter() - t0_lote
+            for k in activos:
+                tiempos[k] += t_lote
+
+        # 4) IA + normalización por documento (en paralelo)
+        async def _do_rut():
+            t0 = time.perf_counter()
+            if "rut" in lote:
+                rut_raw_data = lote["rut"]
             else:
-                rut_data["_fuente_numero_identificacion"] = "ia_no_validado"
+                rut_raw_data = safe_json_loads(await extract_rut_fields_raw(client, rut_texto))
+            data = normalizar_campos_rut(rut_raw_data, rut_texto=rut_texto)
+
+            # Fallback OCR SOLO para numero_identificacion (campo 26)
+            id_ocr = None
+            rut_num = data.get("numero_identificacion")
+
+            if numero_id_es_sospechoso(rut_num):
+                id_ocr = await asyncio.to_thread(ocr_numero_identificacion_desde_campo26, None, rut_doc)
+                if id_ocr:
+                    data["numero_identificacion"] = id_ocr
+                    data["_fuente_numero_identificacion"] = "ocr_campo26"
+
+            if not id_ocr:
+                numero_validado = validar_numero_identificacion(rut_texto, data.get("numero_identificacion"))
+                if numero_validado:
+                    data["numero_identificacion"] = numero_validado
+                    data["_fuente_numero_identificacion"] = "validado_campo26"
+                else:
+                    data["_fuente_numero_identificacion"] = "ia_no_validado"
 
-        metricas["tiempo_por_documento_s"]["RUT"] = round(time.perf_counter() - t0_rut, 3)
-        metricas["completitud_por_documento_pct"]["RUT"] = calcular_completitud(
-            rut_data, campos_esperados_por_doc("DOC14")
-        )
-    else:
-        metricas["tiempo_por_documento_s"]["RUT"] = None
-        metricas["completitud_por_documento_pct"]["RUT"] = None
-
-    # 3) DOC12 (Cédula) — si llegan varios, tomamos el primero (MVP)
-    if buckets["DOC12"]:
-        it = buckets["DOC12"][0]
-        t0_cc = time.perf_counter()
-        cc_bytes = open(it.path, "rb").read()
-
-        images = pdf_to_images_pymupdf(cc_bytes, zoom=2.5)
-        cc_ocr_text = ocr_images_easyocr(images)
-        cc_ocr_text = limpiar_texto_para_llm(cc_ocr_text)
-
-        raw_cc = extract_cc_fields_raw(client, cc_ocr_text)
-        cc_data = normalizar_campos_cc(safe_json_loads(raw_cc))
-
-        # Métricas Cédula (con valores fijos del diccionario)
-        cc_eval = (cc_data or {}).copy()
-        cc_eval["doc_tipo"] = "Documento de identidad (Cédula de ciudadanía) – imagen anverso/reverso"
-        cc_eval.setdefault("doc_pais_emisor", "República de Colombia")
-        cc_eval.setdefault("doc_tipo_documento", "Cédula de ciudadanía")
-
-        metricas["tiempo_por_documento_s"]["CEDULA"] = round(time.perf_counter() - t0_cc, 3)
-        metricas["completitud_por_documento_pct"]["CEDULA"] = calcular_completitud(
-            cc_eval, campos_esperados_por_doc("DOC12")
-        )
-    else:
-        metricas["tiempo_por_documento_s"]["CEDULA"] = None
-        metricas["completitud_por_documento_pct"]["CEDULA"] = None
+            tiempo = round(tiempos["RUT"] + time.perf_counter() - t0, 3)
+            return data, tiempo, calcular_completitud(data, campos_esperados_por_doc("DOC14"))
 
-    # 4) DOC16 (Certificación bancaria) — si llegan varios, tomamos el primero (MVP)
-    if buckets["DOC16"]:
-        it = buckets["DOC16"][0]
-        t0_doc16 = time.perf_counter()
-        doc16_bytes = open(it.path, "rb").read()
+        async def _do_cc():
+            t0 = time.perf_counter()
+            if "cc" in lote:
+                cc_raw_data = lote["cc"]
+            else:
+                cc_raw_data = safe_json_loads(await extract_cc_fields_raw(client, cc_ocr_text))
+            data = normalizar_campos_cc(cc_raw_data)
+
+            # Métricas Cédula (con valores fijos del diccionario)
+            cc_eval = (data or {}).copy()
+            cc_eval["doc_tipo"] = "Documento de identidad (Cédula de ciudadanía) – imagen anverso/reverso"
+            cc_eval.setdefault("doc_pais_emisor", "República de Colombia")
+            cc_eval.setdefault("doc_tipo_documento", "Cédula de ciudadanía")
+
+            tiempo = round(tiempos["CEDULA"] + time.perf_counter() - t0, 3)
+            return data, tiempo, calcular_completitud(cc_eval, campos_esperados_por_doc("DOC12"))
+
+        async def _do_doc16():
+            t0 = time.perf_counter()
+            if "doc16" in lote:
+                doc16_raw_data = lote["doc16"]
+            else:
+                doc16_raw_data = safe_json_loads(await extract_doc16_fields_raw(client, doc16_texto))
+            data = normalizar_campos_doc16(doc16_raw_data, texto=doc16_texto)
 
-        doc16_texto = extract_doc16_text(doc16_bytes)
+            # Métricas DOC16 (con valor fijo doc_tipo)
+            doc16_eval = (data or {}).copy()
+            doc16_eval["doc_tipo"] = "Certificación bancaria"
 
-        raw_16 = extract_doc16_fields_raw(client, doc16_texto)
-        doc16_data = normalizar_campos_doc16(safe_json_loads(raw_16), texto=doc16_texto)
+            tiempo = round(tiempos["DOC16"] + time.perf_counter() - t0, 3)
+            return data, tiempo, calcular_completitud(doc16_eval, campos_esperados_por_doc("DOC16"))
 
-        # Métricas DOC16 (con valor fijo doc_tipo)
-        doc16_eval = (doc16_data or {}).copy()
-        doc16_eval["doc_tipo"] = "Certificación bancaria"
+        fases_ia = {"RUT": _do_rut, "CEDULA": _do_cc, "DOC16": _do_doc16}
+        res = await asyncio.gather(*(fases_ia[n]() for n in activos), return_exceptions=True)
+        resultados = dict(zip(activos, res))
+        activos = _quitar_fallidos(logs, activos, res, "Error en extracción IA")
 
-        metricas["tiempo_por_documento_s"]["DOC16"] = round(time.perf_counter() - t0_doc16, 3)
-        metricas["completitud_por_documento_pct"]["DOC16"] = calcular_completitud(
-            doc16_eval, campos_esperados_por_doc("DOC16")
-        )
-    else:
-        metricas["tiempo_por_documento_s"]["DOC16"] = None
-        metricas["completitud_por_documento_pct"]["DOC16"] = None
+    for nombre in ("RUT", "CEDULA", "DOC16"):
+        if nombre in activos:
+            data, tiempo, completitud = resultados[nombre]
+        else:
+            data, tiempo, completitud = None, None, None
+        metricas["tiempo_por_documento_s"][nombre] = tiempo
+        metricas["completitud_por_documento_pct"][nombre] = completitud
+        if nombre == "RUT":
+            rut_data = data
+        elif nombre == "CEDULA":
+            cc_data = data
+        else:
+            doc16_data = data
 
-    # 5) Validación (NO forzar) + logs
+    # 7) Validación (NO forzar) + logs
     if cc_data:
         logs = validar_cedula_vacia(cc_data, logs)
 
@@ -978,15 +1454,15 @@ def run_pipeline(items: List[DocItem], client: OpenAI) -> Dict[str, Any]:
     metricas["warnings_por_documento"]["DOC16"] = contar_warnings(logs, "CERTIFICACION_BANCARIA")
     metricas["warnings_por_documento"]["VALIDACION_CRUZADA"] = contar_warnings(logs, "VALIDACION_CRUZADA")
 
-    # 6) Consolidado + Excel
-    df_master = fill_master_values(rut_data, cc_data, doc16_data)
-    excel_bytes = dataframe_to_excel_bytes(df_master)
+    # 8) Consolidado + Excel
+    master_records = fill_master_records(rut_data, cc_data, doc16_data)
+    excel_bytes = await asyncio.to_thread(records_to_excel_bytes, master_records)
 
     return {
         "rut_data": rut_data,
         "cc_data": cc_data,
         "doc16_data": doc16_data,
-        "df_master": df_master.to_dict(orient="records"),
+        "df_master": master_records,
         "excel_bytes": excel_bytes,
         "logs": logs,
         "metricas": metricas,
@@ -1002,8 +1478,22 @@ def run_pipeline(items: List[DocItem], client: OpenAI) -> Dict[str, Any]:
 # =========================
 # Helper opcional
 # =========================
-def build_openai_client_from_env() -> OpenAI:
+def build_openai_client_from_env() -> AsyncOpenAI:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("Falta OPENAI_API_KEY en variables de entorno del backend.")
-    return OpenAI(api_key=api_key)
+    return AsyncOpenAI(api_key=api_key)
+
+
+def run_pipeline_blocking(items: List[DocItem]) -> Dict[str, Any]:
+    """
+    Versión síncrona de run_pipeline para correr en otro proceso (ProcessPoolExecutor).
+    El cliente se crea por llamada: un AsyncOpenAI queda atado al event loop de asyncio.run.
+    """
+    return asyncio.run(run_pipeline(items, build_openai_client_from_env()))
+
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> AsyncOpenAI:
+    """Cliente OpenAI único por proceso (reusa el pool de conexiones HTTP entre requests)."""
+    return build_openai_client_from_env()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+# ============================================================
+# 🧠 Cache de respuestas LLM (por hash de contenido)
+# - La clave es sha256(modelo | versión de prompt | prompt completo)
+# - Reprocesar el mismo documento (reintentos, re-aprobación) no vuelve a llamar a OpenAI
+# - Un archivo por entrada en {OCR_ATENEA_DATA_DIR}/llm_cache/
+#
+# ⚠️ PII: las respuestas contienen números de identificación y cuentas bancarias
+#    y se guardan SIN cifrar en disco. Por eso:
+# - Viene DESACTIVADO por defecto; LLM_CACHE=1 lo activa
+# - LLM_CACHE_TTL_S: vida de cada entrada (por defecto 7 días); al expirar se borra
+# - LLM_CACHE_MAX_FILES: tope de entradas (por defecto 2000); se podan las más viejas
+# ============================================================
+
+CACHE_DIR = Path(os.getenv("OCR_ATENEA_DATA_DIR", "./data")).resolve() / "llm_cache"
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "0").strip() == "1"
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_FILES = int(os.getenv("LLM_CACHE_MAX_FILES", "2000"))
+
+# La poda recorre el directorio: se hace cada N escrituras, no en todas
+_PRUNE_EVERY = 50
+_writes = 0
+_prune_lock = threading.Lock()
+
+
+def make_key(model: str, prompt_version: str, text: str) -> str:
+    return hashlib.sha256(f"{model}|{prompt_version}|{text}".encode("utf-8")).hexdigest()
+
+
+def _key_path(key: str) -> Path:
+    # 2 niveles para no llenar un solo directorio
+    return CACHE_DIR / key[:2] / f"{key}.json"
+
+
+def _expirado(mtime: float, now: float) -> bool:
+    return LLM_CACHE_TTL_S > 0 and now - mtime > LLM_CACHE_TTL_S
+
+
+def get(key: str) -> Optional[str]:
+    if not LLM_CACHE_ENABLED:
+        return None
+    p = _key_path(key)
+    try:
+        if _expirado(p.stat().st_mtime, time.time()):
+            p.unlink(missing_ok=True)
+            return None
+        return p.read_text(encoding="utf-8")
+    except (FileNotFoundError, OSError):
+        return None
+
+
+def prune() -> int:
+    """
+    Borra entradas expiradas y, si aún se supera LLM_CACHE_MAX_FILES, las más viejas.
+    Devuelve cuántas borró.
+    """
+    if not CACHE_DIR.exists():
+        return 0
+    now = time.time()
+    vivas = []
+    borradas = 0
+    for p in CACHE_DIR.glob("*/*.json"):
+        try:
+            mtime = p.stat().st_mtime
+            if _expirado(mtime, now):
+                p.unlink(missing_ok=True)
+                borradas += 1
+            else:
+                vivas.append((mtime, p))
+        except OSError:
+            continue
+
+    exceso = len(vivas) - LLM_CACHE_MAX_FILES
+    if LLM_CACHE_MAX_FILES > 0 and exceso > 0:
+        vivas.sort(key=lambda t: t[0])
+        for _, p in vivas[:exceso]:
+            try:
+                p.unlink(missing_ok=True)
+                borradas += 1
+            except OSError:
+                continue
+    return borradas
+
+
+def _maybe_prune() -> None:
+    global _writes
+    with _prune_lock:
+        _writes += 1
+        if _writes % _PRUNE_EVERY != 1:
+            return
+        prune()
+
+
+def put(key: str, value: str) -> None:
+    """
+    Escritura atómica (tmp + replace): un lector concurrente nunca ve un JSON a medias.
+    Un fallo de disco no debe tumbar el pipeline: se ignora.
+    """
+    if not LLM_CACHE_ENABLED or not value:
+        return
+    p = _key_path(key)
+    try:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp.write_text(value, encoding="utf-8")
+        os.replace(tmp, p)
+    except OSError:
+        return
+    _maybe_prune()
@@ -2,38 +2,57 @@
 from __future__ import annotations
 
 import os
-import json
+import re
+import asyncio
+import tempfile
+import time
+import hashlib
+import multiprocessing
 import uuid
 import mimetypes
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import BinaryIO, List, Optional, Dict, Any
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, Response
+from fastapi import BackgroundTasks, FastAPI, UploadFile, File, HTTPException, Query
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, ConfigDict
+import httpx
 
-# Cliente Supabase (ya lo tienes)
-from supabase_config import supabase
+# Cliente Supabase (uno por proceso, el mismo que usa storage.py)
+from supabase_config import require_supabase_client, SUPABASE_URL, SUPABASE_KEY, BUCKET as SUPABASE_BUCKET
 
 # Pipeline
-from core_extractor import DocItem, build_openai_client_from_env, run_pipeline
+from core_extractor import DocItem, get_openai_client, run_pipeline, run_pipeline_blocking, warmup_ocr
 
 # ✅ Storage (local fallback o Supabase, según variables de entorno)
 from storage import (
     save_uploads,
+    save_upload_entry,
     get_uploads,
     save_result,
     get_result,
+    get_result_bytes,
     save_excel,
-    get_excel,
+    copy_excel,
+    get_excel_local_path,
+    save_status,
+    get_status,
+    save_case_by_hash,
+    get_case_by_hash,
+    save_file_by_hash,
+    get_file_by_hash,
+    dumps_json,
 )
 
 # =========================
 # ⚙️ Config
 # =========================
 APP_NAME = "OCR Atenea Backend API"
-SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "ocr-atenea").strip()
 
 DATA_DIR = Path(os.environ.get("OCR_ATENEA_DATA_DIR", "./data")).resolve()
 DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -41,28 +60,65 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 TMP_DIR = DATA_DIR / "tmp"
 TMP_DIR.mkdir(parents=True, exist_ok=True)
 
+# Procesos dedicados al pipeline (OCR/LLM). 0 = en este mismo proceso (hilos + asyncio).
+# Con N > 0 el OCR no compite por el GIL con las demás rutas; cada proceso carga su propio EasyOCR.
+PIPELINE_PROCESSES = int(os.getenv("PIPELINE_PROCESSES", "0"))
+
+# Tamaño de bloque al recibir uploads (RAM por request = 1 bloque, no el archivo completo)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+# Tamaño máximo por archivo: se corta mientras llega, sin haberlo recibido completo
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "25"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+# idx por archivo en /upload_one y /upload_known: 0..999 (prefijo {idx:03d}_ en el bucket,
+# y el listado de entradas de upload trae hasta 1000 objetos)
+MAX_FILES_PER_CASE = 1000
+# Un caso en queued/processing por más de esto se considera abandonado y se puede reencolar
+PROCESS_STALE_S = float(os.getenv("PROCESS_STALE_S", "1800"))
+
 
 # =========================
 # 🧱 Modelos API
 # =========================
+# Respuestas inmutables; las construimos nosotros con model_construct (datos ya confiables,
+# sin pasar de nuevo por validación)
 class UploadResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     case_id: str
     files_uploaded: List[dict]
 
 
 class ProcessResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     case_id: str
     status: str
     result_path: str
     excel_path: Optional[str] = None
 
 
+class KnownHashesRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+    sha256: List[str]
+
+
 class ApproveRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     approved: bool
     reviewer: Optional[str] = None
     comments: Optional[str] = None
 
 
+def _model_response(model: BaseModel, status_code: int = 200) -> ORJSONResponse:
+    """
+    Devuelve el modelo ya construido sin que FastAPI lo re-valide contra response_model
+    ni lo pase por jsonable_encoder (response_model queda solo para la documentación).
+    """
+    return ORJSONResponse(model.model_dump(), status_code=status_code)
+
+
 # =========================
 # 🔧 Helpers
 # =========================
@@ -71,6 +127,11 @@ def _detect_content_type(filename: str, fallback: str = "application/octet-strea
     return ctype or fallback
 
 
+def _safe_name(name: Optional[str]) -> str:
+    """Nombre de archivo sin separadores de ruta (se calcula una vez, al subir, y queda en meta.json)."""
+    return (name or "archivo").strip().replace("/", "_").replace("\\", "_")
+
+
 def _tmp_case_dir(case_id: str) -> Path:
     """
     Carpeta temporal donde descargamos PDFs/imagenes desde Supabase
@@ -87,17 +148,60 @@ def _download_from_supabase(storage_path: str) -> bytes:
     storage_path ejemplo: "{case_id}/input/RUT.pdf"
     """
     try:
-        return supabase.storage.from_(SUPABASE_BUCKET).download(storage_path)
+        return require_supabase_client().storage.from_(SUPABASE_BUCKET).download(storage_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error descargando desde Supabase: {storage_path} - {e}")
 
 
-def _upload_bytes_to_supabase(storage_path: str, content: bytes, content_type: str) -> None:
+@lru_cache(maxsize=1)
+def _storage_http() -> httpx.Client:
+    """Cliente HTTP compartido (pool de conexiones) para descargas en streaming."""
+    return httpx.Client(
+        base_url=f"{SUPABASE_URL.rstrip('/')}/storage/v1",
+        headers={"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY},
+        timeout=httpx.Timeout(60.0, connect=10.0),
+    )
+
+
+def _download_to_path(storage_path: str, dest: Path) -> None:
+    """
+    Descarga un archivo de Supabase Storage directo a disco, por bloques de 1 MiB
+    (el cliente supabase solo devuelve el archivo completo como bytes).
+    """
+    url = f"/object/authenticated/{SUPABASE_BUCKET}/{storage_path}"
+    try:
+        with _storage_http().stream("GET", url) as resp:
+            resp.raise_for_status()
+            with dest.open("wb") as out:
+                for chunk in resp.iter_bytes(chunk_size=UPLOAD_CHUNK_SIZE):
+                    out.write(chunk)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error descargando desde Supabase: {storage_path} - {e}")
+
+
+def _copy_storage_object(src: str, dst: str, content_type: str) -> None:
+    """
+    Copia un objeto dentro del bucket del lado de Supabase (los bytes no pasan por aquí).
+    copy no sobrescribe: si el destino ya existe (reintento), se re-sube por streaming con upsert.
+    """
+    try:
+        require_supabase_client().storage.from_(SUPABASE_BUCKET).copy(src, dst)
+        return
+    except Exception:
+        pass
+    with tempfile.TemporaryDirectory(prefix="ocr_atenea_copy_") as tmp:
+        tmp_path = Path(tmp) / "obj"
+        _download_to_path(src, tmp_path)
+        _upload_path_to_supabase(dst, tmp_path, content_type)
+
+
+def _upload_bytes_to_supabase(storage_path: str, content: bytes | BinaryIO, content_type: str) -> None:
     """
     Sube bytes a Supabase Storage con upsert.
+    Si content es un archivo abierto ("rb"), el cliente lo envía por streaming (sin cargarlo en RAM).
     """
     try:
-        res = supabase.storage.from_(SUPABASE_BUCKET).upload(
+        res = require_supabase_client().storage.from_(SUPABASE_BUCKET).upload(
             storage_path,
             content,
             {
@@ -113,20 +217,116 @@ def _upload_bytes_to_supabase(storage_path: str, content: bytes, content_type: s
         raise HTTPException(status_code=500, detail=f"Error subiendo a Supabase: {storage_path} - {e}")
 
 
+@lru_cache(maxsize=1)
+def _pipeline_pool() -> ProcessPoolExecutor:
+    # spawn: no se hace fork de un proceso con hilos / torch ya cargado
+    return ProcessPoolExecutor(
+        max_workers=PIPELINE_PROCESSES,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=warmup_ocr,
+    )
+
+
+def _download_item(tmp_dir: Path, idx: int, u: dict) -> Optional[DocItem]:
+    """
+    Descarga un archivo del caso a tmp (el pipeline necesita paths locales).
+    Es bloqueante: /process lo llama vía asyncio.to_thread, un hilo por archivo.
+    Se escribe a disco en streaming (sin el archivo completo en memoria).
+    """
+    storage_path = u.get("storage_path")
+    # saved_name y content_type vienen de meta.json (calculados en /upload);
+    # recalcular solo para registros antiguos que no los traen
+    saved_name = u.get("saved_name") or _safe_name(u.get("original_name"))
+    content_type = u.get("content_type") or _detect_content_type(saved_name)
+
+    if not storage_path:
+        return None
+
+    # idx en el nombre: dos uploads con el mismo nombre se descargan en paralelo sin pisarse
+    # (el pipeline clasifica por original_name, no por el path)
+    local_path = tmp_dir / f"{idx:03d}_{saved_name}"
+    _download_to_path(storage_path, local_path)
+
+    return DocItem(
+        path=str(local_path),
+        original_name=str(saved_name),
+        content_type=content_type,
+    )
+
+
+async def _download_items(case_id: str, uploads: List[dict]) -> List[DocItem]:
+    """Descarga todos los archivos en paralelo (cada descarga es un round-trip a Supabase)."""
+    tmp_dir = await asyncio.to_thread(_tmp_case_dir, case_id)
+    items = await asyncio.gather(
+        *(asyncio.to_thread(_download_item, tmp_dir, i, u) for i, u in enumerate(uploads))
+    )
+    return [it for it in items if it is not None]
+
+
 # =========================
 # 🚀 FastAPI
 # =========================
-app = FastAPI(title=APP_NAME)
+# orjson serializa los dicts de respuesta (resultados, métricas) más rápido que json
+app = FastAPI(title=APP_NAME, default_response_class=ORJSONResponse)
+
+# CORS: orígenes explícitos (CORS_ORIGINS="https://a.com,https://b.com"); "*" con credenciales no es válido
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()] or ["http://localhost:8501"]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # en prod: cambia por tus dominios
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=600,  # el navegador reusa el preflight 10 min
 )
 
 
+class _GZipSalvoExport(GZipMiddleware):
+    """
+    GZip para todo menos /export: el xlsx ya es un zip (comprimirlo gasta CPU sin ganar bytes)
+    y envolver el body anula el envío directo del archivo de FileResponse.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith("/export/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Respuestas > 1 KB comprimidas si el cliente acepta gzip (nivel 1: casi sin costo de CPU)
+app.add_middleware(_GZipSalvoExport, minimum_size=1024, compresslevel=1)
+
+
+@app.on_event("startup")
+def _check_supabase():
+    # Los inputs siempre van al bucket: sin variables de Supabase el backend no arranca
+    require_supabase_client()
+
+
+@app.on_event("startup")
+async def _warmup():
+    # Carga EasyOCR (torch) en un hilo aparte: /health responde de inmediato y la
+    # primera request de OCR espera al mismo Reader (su creación va bajo lock).
+    # Con pool de procesos, cada worker del pool lo carga al iniciar (no aquí).
+    if PIPELINE_PROCESSES > 0:
+        _pipeline_pool()
+    else:
+        asyncio.get_running_loop().run_in_executor(None, warmup_ocr)
+    try:
+        get_openai_client()
+    except RuntimeError:
+        # Sin OPENAI_API_KEY: /process lo reportará en su momento
+        pass
+
+
+@app.on_event("shutdown")
+def _shutdown_pool():
+    if PIPELINE_PROCESSES > 0:
+        _pipeline_pool().shutdown(cancel_futures=True)
+
+
 @app.get("/health")
 def health():
     return {"status": "ok", "service": APP_NAME}
@@ -135,85 +335,250 @@ def health():
 # =========================
 # 1) 📤 Upload (Supabase Storage + index en storage.save_uploads)
 # =========================
+def _spool_to_tmp(src: BinaryIO, dest: Path, original_name: str) -> tuple[int, str]:
+    """
+    Copia el upload a un archivo temporal por bloques (tamaño + sha256 al vuelo).
+    Corta apenas supera MAX_UPLOAD_MB. Bloqueante: se llama vía asyncio.to_thread.
+    """
+    h = hashlib.sha256()
+    size = 0
+    limit = MAX_UPLOAD_BYTES
+    with dest.open("wb") as out:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > limit:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Archivo demasiado grande: {original_name} (máx. {MAX_UPLOAD_MB} MB).",
+                )
+            h.update(chunk)
+            out.write(chunk)
+    return size, h.hexdigest()
+
+
+def _upload_path_to_supabase(storage_path: str, path: Path, content_type: str) -> None:
+    with path.open("rb") as fh:
+        _upload_bytes_to_supabase(storage_path, fh, content_type)
+
+
+def _input_storage_path(case_id: str, idx: int, safe_name: str) -> str:
+    # idx en la ruta: dos archivos con el mismo nombre en un caso no se pisan en el bucket
+    return f"{case_id}/input/{idx:03d}_{safe_name}"
+
+
+async def _save_one(case_id: str, idx: int, f: UploadFile) -> dict:
+    """Un archivo del request: tmp local → Supabase. Corre en paralelo con los demás."""
+    original_name = (f.filename or "archivo").strip()
+    safe_name = _safe_name(original_name)
+
+    content_type = f.content_type or _detect_content_type(safe_name)
+
+    # Recibir por bloques a un archivo temporal (idx: nombres repetidos no chocan)
+    tmp_path = (await asyncio.to_thread(_tmp_case_dir, case_id)) / f"upload_{idx}_{safe_name}"
+    try:
+        size, sha256 = await asyncio.to_thread(_spool_to_tmp, f.file, tmp_path, original_name)
+
+        # Guardar en Supabase: {case_id}/input/{idx}_{filename}
+        storage_path = _input_storage_path(case_id, idx, safe_name)
+        await asyncio.to_thread(_upload_path_to_supabase, storage_path, tmp_path, content_type)
+    finally:
+        await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+
+    meta = {
+        "original_name": original_name,
+        "saved_name": safe_name,
+        "storage_path": storage_path,
+        "content_type": content_type,
+        "size_bytes": size,
+        "sha256": sha256,
+    }
+    # Índice por contenido: /upload_known reusa este archivo sin volver a recibirlo
+    await asyncio.to_thread(save_file_by_hash, sha256, meta)
+    return meta
+
+
 @app.post("/upload", response_model=UploadResponse)
 async def upload(files: List[UploadFile] = File(...)):
     if not files:
         raise HTTPException(status_code=400, detail="No se recibieron archivos.")
 
     case_id = uuid.uuid4().hex
-    uploads_meta: List[dict] = []
 
-    for f in files:
-        original_name = (f.filename or "archivo").strip()
-        safe_name = original_name.replace("/", "_").replace("\\", "_")
+    # Todos los archivos en paralelo (disco + round-trip a Supabase se solapan); mantiene el orden
+    uploads_meta: List[dict] = list(
+        await asyncio.gather(*(_save_one(case_id, i, f) for i, f in enumerate(files)))
+    )
 
-        content = await f.read()
-        content_type = f.content_type or _detect_content_type(safe_name)
+    # ✅ Índice de uploads + estado en un solo write (Supabase si está configurado, o local fallback)
+    await asyncio.to_thread(save_uploads, case_id, uploads_meta, "uploaded", {"n_files": len(uploads_meta)})
 
-        # Guardar en Supabase: {case_id}/input/{filename}
-        storage_path = f"{case_id}/input/{safe_name}"
-        _upload_bytes_to_supabase(storage_path, content, content_type)
+    return _model_response(UploadResponse.model_construct(case_id=case_id, files_uploaded=uploads_meta))
 
-        uploads_meta.append(
-            {
-                "original_name": original_name,
-                "saved_name": safe_name,
-                "storage_path": storage_path,
-                "content_type": content_type,
-                "size_bytes": len(content),
-            }
-        )
 
-    # ✅ Guardar índice de uploads (en Supabase si está configurado, o local fallback)
-    save_uploads(case_id, uploads_meta)
+def _case_id_or_new(case_id: Optional[str]) -> str:
+    if case_id is None:
+        return uuid.uuid4().hex
+    if not case_id.isalnum():
+        raise HTTPException(status_code=400, detail="case_id inválido.")
+    return case_id
 
-    return UploadResponse(case_id=case_id, files_uploaded=uploads_meta)
+
+@app.post("/upload_one", response_model=UploadResponse)
+async def upload_one(
+    file: UploadFile = File(...),
+    case_id: Optional[str] = None,
+    idx: int = Query(0, ge=0, lt=MAX_FILES_PER_CASE),
+):
+    """
+    Un archivo por request: el frontend sube varios en paralelo.
+    Sin case_id crea el caso; con case_id agrega el archivo a ese caso.
+    Cada archivo queda en su propio objeto (idx): requests concurrentes no se pisan.
+    """
+    nuevo = case_id is None
+    case_id = _case_id_or_new(case_id)
+    meta = await _save_one(case_id, idx, file)
+    await asyncio.to_thread(save_upload_entry, case_id, idx, meta)
+    if nuevo:
+        await asyncio.to_thread(save_status, case_id, "uploaded")
+
+    return _model_response(UploadResponse.model_construct(case_id=case_id, files_uploaded=[meta]))
+
+
+_RE_SHA256 = re.compile(r"[0-9a-fA-F]{64}")
+MAX_KNOWN_HASHES = 200
+
+
+def _check_sha256(sha256: str) -> str:
+    if not _RE_SHA256.fullmatch(sha256):
+        raise HTTPException(status_code=400, detail="sha256 inválido.")
+    return sha256.lower()
+
+
+@app.post("/uploads/known")
+async def known_hashes(payload: KnownHashesRequest):
+    """
+    Cuáles de estos sha256 ya recibió el backend, en una sola request para todo el lote:
+    el cliente solo usa /upload_known para esos (el resto va directo a /upload_one).
+    """
+    if len(payload.sha256) > MAX_KNOWN_HASHES:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_KNOWN_HASHES} hashes por request.")
+    hashes = list(dict.fromkeys(_check_sha256(h) for h in payload.sha256))
+    previos = await asyncio.gather(*(asyncio.to_thread(get_file_by_hash, h) for h in hashes))
+    return {"known": [h for h, p in zip(hashes, previos) if p and p.get("storage_path")]}
+
+
+@app.post("/upload_known", response_model=UploadResponse)
+async def upload_known(
+    sha256: str,
+    filename: str,
+    case_id: Optional[str] = None,
+    idx: int = Query(0, ge=0, lt=MAX_FILES_PER_CASE),
+):
+    """
+    Agrega al caso un archivo que el backend ya recibió antes (mismo sha256), sin recibir sus bytes:
+    se copia dentro del bucket al input de este caso (el caso no depende de los archivos de otro).
+    404 si el contenido no se conoce o ya no está: el cliente lo sube con /upload_one.
+    """
+    sha256 = _check_sha256(sha256)
+    prior = await asyncio.to_thread(get_file_by_hash, sha256)
+    if not prior or not prior.get("storage_path"):
+        raise HTTPException(status_code=404, detail="Contenido no conocido; súbelo con /upload_one.")
+
+    nuevo = case_id is None
+    case_id = _case_id_or_new(case_id)
+    original_name = (filename or "archivo").strip()
+    safe_name = _safe_name(original_name)
+    storage_path = _input_storage_path(case_id, idx, safe_name)
+    content_type = prior.get("content_type") or _detect_content_type(safe_name)
+    try:
+        await asyncio.to_thread(_copy_storage_object, prior["storage_path"], storage_path, content_type)
+    except HTTPException:
+        raise HTTPException(status_code=404, detail="Contenido ya no disponible; súbelo con /upload_one.")
+
+    meta = {
+        "original_name": original_name,
+        "saved_name": safe_name,
+        "storage_path": storage_path,
+        "content_type": content_type,
+        "size_bytes": prior.get("size_bytes"),
+        "sha256": sha256,
+    }
+    await asyncio.to_thread(save_upload_entry, case_id, idx, meta)
+    if nuevo:
+        await asyncio.to_thread(save_status, case_id, "uploaded")
+
+    return _model_response(UploadResponse.model_construct(case_id=case_id, files_uploaded=[meta]))
 
 
 # =========================
 # 2) 🧠 Process (descarga desde Supabase → temp local → run_pipeline → guarda result/excel)
 # =========================
-@app.post("/process/{case_id}", response_model=ProcessResponse)
-def process(case_id: str):
-    uploads = get_uploads(case_id)
-    if not uploads:
-        raise HTTPException(
-            status_code=404,
-            detail="case_id no existe o no tiene uploads registrados. Ejecuta /upload primero.",
-        )
+def _combined_hash(uploads: List[dict]) -> Optional[str]:
+    """
+    Hash del caso = sha256 de los (sha256, nombre) de sus archivos, ordenados.
+    El nombre entra porque el pipeline clasifica por nombre de archivo.
+    None si algún upload no trae sha256 (casos anteriores a su registro).
+    """
+    pares = []
+    for u in uploads:
+        if not u.get("sha256"):
+            return None
+        pares.append(f"{u['sha256']}:{u.get('saved_name') or ''}")
+    return hashlib.sha256("\n".join(sorted(pares)).encode("utf-8")).hexdigest()
 
-    # 1) Cliente OpenAI (API KEY en env del backend)
-    client = build_openai_client_from_env()
 
-    # 2) Descargar archivos a tmp para procesar (pipeline necesita paths)
-    tmp_dir = _tmp_case_dir(case_id)
-    items: List[DocItem] = []
+def _reuse_previous_result(case_id: str, content_hash: str) -> Optional[ProcessResponse]:
+    """
+    Si otro caso ya procesó exactamente los mismos archivos, copia su result/excel
+    a este case_id (sin OCR ni LLM). Bloqueante: se llama vía asyncio.to_thread.
+    """
+    prior = get_case_by_hash(content_hash)
+    if not prior or prior == case_id:
+        return None
+    result = get_result(prior)
+    if not result:
+        return None
+
+    save_result(case_id, {**result, "reutilizado_de_case_id": prior})
+    excel_path = None
+    if copy_excel(prior, case_id):
+        excel_path = f"{case_id}/output/output.xlsx"
 
-    for u in uploads:
-        storage_path = u.get("storage_path")
-        saved_name = u.get("saved_name") or u.get("original_name") or "archivo"
-        content_type = u.get("content_type") or _detect_content_type(saved_name)
-
-        if not storage_path:
-            continue
-
-        data = _download_from_supabase(storage_path)
-        local_path = tmp_dir / saved_name
-        local_path.write_bytes(data)
-
-        items.append(
-            DocItem(
-                path=str(local_path),
-                original_name=str(saved_name),
-                content_type=content_type,
-            )
-        )
+    return ProcessResponse.model_construct(
+        case_id=case_id,
+        status="processed",
+        result_path=f"{case_id}/output/result.json",
+        excel_path=excel_path,
+    )
+
+
+async def _process_case(case_id: str, uploads: List[dict], client, force: bool = False) -> ProcessResponse:
+    """
+    Descarga → pipeline → guarda result/excel. Lo usan el modo síncrono y el de fondo.
+    Archivos idénticos a un caso ya procesado reutilizan su resultado (salvo force=True).
+    """
+    content_hash = _combined_hash(uploads)
+    if content_hash and not force:
+        try:
+            reused = await asyncio.to_thread(_reuse_previous_result, case_id, content_hash)
+        except Exception:
+            # Es solo un atajo: si el caso anterior no se puede leer, se procesa normal
+            reused = None
+        if reused is not None:
+            return reused
+
+    # 2) Descargar archivos a tmp para procesar (pipeline necesita paths)
+    items = await _download_items(case_id, uploads)
 
     if not items:
         raise HTTPException(status_code=400, detail="No se pudieron preparar archivos para el pipeline.")
 
-    # 3) Ejecutar pipeline
-    result: Dict[str, Any] = run_pipeline(items, client)
+    # 3) Ejecutar pipeline (RUT / Cédula / DOC16 en paralelo)
+    if PIPELINE_PROCESSES > 0:
+        loop = asyncio.get_running_loop()
+        result: Dict[str, Any] = await loop.run_in_executor(_pipeline_pool(), run_pipeline_blocking, items)
+    else:
+        result = await run_pipeline(items, client)
 
     # 4) Separar Excel (si viene en el dict)
     excel_bytes = None
@@ -221,12 +586,12 @@ def process(case_id: str):
         excel_bytes = result.pop("excel_bytes", None) or result.pop("excel", None)
 
     # 5) Guardar JSON de resultados (Supabase o local fallback)
-    save_result(case_id, result)
+    await asyncio.to_thread(save_result, case_id, result)
 
     # 6) Guardar Excel (Supabase o local fallback)
     excel_path = None
     if excel_bytes:
-        save_excel(case_id, excel_bytes)
+        await asyncio.to_thread(save_excel, case_id, excel_bytes)
         # para “compatibilidad” devolvemos un path lógico
         excel_path = f"{case_id}/output/output.xlsx"
 
@@ -236,7 +601,10 @@ def process(case_id: str):
     # Ruta lógica del JSON en Supabase (o local)
     result_path = f"{case_id}/output/result.json"
 
-    return ProcessResponse(
+    if content_hash:
+        await asyncio.to_thread(save_case_by_hash, content_hash, case_id)
+
+    return ProcessResponse.model_construct(
         case_id=case_id,
         status="processed",
         result_path=result_path,
@@ -244,31 +612,135 @@ def process(case_id: str):
     )
 
 
+async def _process_job(case_id: str, uploads: List[dict], client, force: bool = False) -> None:
+    """Tarea de fondo: procesa el caso y deja el avance en status.json."""
+    await asyncio.to_thread(save_status, case_id, "processing")
+    try:
+        resp = await _process_case(case_id, uploads, client, force)
+    except HTTPException as e:
+        await asyncio.to_thread(save_status, case_id, "error", {"detail": e.detail})
+    except Exception as e:
+        await asyncio.to_thread(save_status, case_id, "error", {"detail": str(e)})
+    else:
+        await asyncio.to_thread(
+            save_status, case_id, "processed",
+            {"result_path": resp.result_path, "excel_path": resp.excel_path},
+        )
+
+
+@app.post("/process/{case_id}", response_model=ProcessResponse)
+async def process(
+    case_id: str,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    force: bool = False,
+):
+    """
+    background=false (default): procesa y responde al terminar (como antes).
+    background=true: responde 202 de inmediato y procesa en segundo plano;
+    el avance se consulta en GET /process/{case_id}/status.
+    force=true: reprocesa aunque los mismos archivos ya tengan un resultado previo.
+    """
+    uploads = await asyncio.to_thread(get_uploads, case_id)
+    if not uploads:
+        raise HTTPException(
+            status_code=404,
+            detail="case_id no existe o no tiene uploads registrados. Ejecuta /upload primero.",
+        )
+
+    # Ya en cola o procesándose (p. ej. un reintento del cliente tras un timeout): no se lanza
+    # una segunda corrida que compita por result.json / output.xlsx. Un estado más viejo que
+    # PROCESS_STALE_S se considera abandonado (worker caído) y se vuelve a encolar.
+    status = await asyncio.to_thread(get_status, case_id)
+    en_curso = (
+        status.get("status") in ("queued", "processing")
+        and time.time() - float(status.get("ts") or 0) < PROCESS_STALE_S
+    )
+    if en_curso:
+        if not background:
+            raise HTTPException(status_code=409, detail=f"El caso ya está en estado '{status['status']}'.")
+        return _model_response(
+            ProcessResponse.model_construct(
+                case_id=case_id,
+                status=status["status"],
+                result_path=f"{case_id}/output/result.json",
+            ),
+            status_code=202,
+        )
+
+    # 1) Cliente OpenAI (API KEY en env del backend)
+    client = get_openai_client()
+
+    if not background:
+        return _model_response(await _process_case(case_id, uploads, client, force))
+
+    await asyncio.to_thread(save_status, case_id, "queued")
+    background_tasks.add_task(_process_job, case_id, uploads, client, force)
+    return _model_response(
+        ProcessResponse.model_construct(
+            case_id=case_id,
+            status="queued",
+            result_path=f"{case_id}/output/result.json",
+        ),
+        status_code=202,
+    )
+
+
+@app.get("/process/{case_id}/status", response_model=None)
+def process_status(case_id: str):
+    # queued | processing | processed | error (con detail) | not_found
+    # Dict leído de nuestro propio status.json: va directo a orjson, sin jsonable_encoder
+    return ORJSONResponse(get_status(case_id), headers={"Cache-Control": "no-store"})
+
+
 # =========================
 # 3) 📦 Results (desde storage)
 # =========================
-@app.get("/results/{case_id}")
+@app.get("/results/{case_id}", response_model=None)
 def get_results_endpoint(case_id: str):
-    data = get_result(case_id)
-    if not data:
+    # El JSON guardado ya es válido: se devuelve tal cual (sin decode → jsonable_encoder → encode)
+    content = get_result_bytes(case_id)
+    if not content:
         raise HTTPException(status_code=404, detail="No hay resultados aún. Ejecuta /process/{case_id}.")
-    return JSONResponse(data)
+    return Response(content=content, media_type="application/json", headers={"Cache-Control": "no-store"})
 
 
 # =========================
 # 4) 💾 Export (Excel desde storage)
 # =========================
-@app.get("/export/{case_id}")
-def export_excel(case_id: str):
-    content = get_excel(case_id)
-    if not content:
-        raise HTTPException(status_code=404, detail="No existe Excel para este case_id. Ejecuta /process primero.")
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
 
-    headers = {"Content-Disposition": f'attachment; filename="ocr_atenea_{case_id}.xlsx"'}
-    return Response(
-        content=content,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+@app.get("/export/{case_id}", response_model=None)
+def export_excel(case_id: str):
+    no_existe = HTTPException(status_code=404, detail="No existe Excel para este case_id. Ejecuta /process primero.")
+    filename = f"ocr_atenea_{case_id}.xlsx"
+
+    # Local: FileResponse (sendfile del kernel, sin copiar el archivo a memoria)
+    local_path = get_excel_local_path(case_id)
+    if local_path is not None:
+        if not local_path.exists():
+            raise no_existe
+        return FileResponse(local_path, media_type=XLSX_MEDIA_TYPE, filename=filename)
+
+    # Supabase: se reenvía la descarga por bloques a medida que llega
+    http = _storage_http()
+    resp = http.send(
+        http.build_request("GET", f"/object/authenticated/{SUPABASE_BUCKET}/{case_id}/output/output.xlsx"),
+        stream=True,
+    )
+    if resp.status_code != 200:
+        resp.close()
+        if resp.status_code in (400, 404):
+            raise no_existe
+        raise HTTPException(status_code=500, detail=f"Error descargando Excel desde Supabase ({resp.status_code}).")
+
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return StreamingResponse(
+        resp.iter_bytes(chunk_size=UPLOAD_CHUNK_SIZE),
+        media_type=XLSX_MEDIA_TYPE,
         headers=headers,
+        background=BackgroundTask(resp.close),
     )
 
 
@@ -290,18 +762,17 @@ def approve_case(case_id: str, payload: ApproveRequest):
     }
 
     # Guardar aprobación en Supabase Storage (meta)
-    approval_bytes = json.dumps(approval, ensure_ascii=False, indent=2).encode("utf-8")
+    approval_bytes = dumps_json(approval)
     _upload_bytes_to_supabase(_approval_storage_path(case_id), approval_bytes, "application/json")
 
     return {"status": "ok", "approval": approval}
 
 
-@app.get("/approve/{case_id}")
+@app.get("/approve/{case_id}", response_model=None)
 def get_approval(case_id: str):
     try:
         data = _download_from_supabase(_approval_storage_path(case_id))
     except HTTPException:
         return {"case_id": case_id, "approved": None}
 
-    approval = json.loads(data.decode("utf-8"))
-    return JSONResponse(approval)
+    return Response(content=data, media_type="application/json", headers={"Cache-Control": "no-store"})
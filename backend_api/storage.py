@@ -2,32 +2,71 @@ from __future__ import annotations
 
 import json
 import os
+import shutil
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+# Config y cliente Supabase (uno por proceso) viven en supabase_config; aquí solo se usan
+from supabase_config import (
+    BUCKET as SUPABASE_BUCKET,
+    SUPABASE_KEY,
+    SUPABASE_URL,
+    get_supabase_client,
+)
+
+try:
+    import orjson  # opcional: serializa/parsea JSON en C (result.json puede ser grande)
+except ImportError:  # pragma: no cover
+    orjson = None
+
 # ============================================================
 # 💾 Storage abstraction (Local fallback + Supabase Storage)
 # - Si SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY existen -> usa Supabase
 # - Si no existen -> usa filesystem local (como tu piloto actual)
 # ============================================================
 
+# -------- JSON (orjson si está instalado, si no json estándar) --------
+def dumps_json(payload: Any, indent: bool = True) -> bytes:
+    """JSON en UTF-8 (sin escapar tildes), tipos raros -> str. indent=False: compacto."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(payload, default=str, option=option)
+    return json.dumps(
+        payload,
+        ensure_ascii=False,
+        indent=2 if indent else None,
+        separators=None if indent else (",", ":"),
+        default=str,
+    ).encode("utf-8")
+
+
+def loads_json(content: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content.decode("utf-8"))
+
+
 # -------- Local (fallback) --------
 BASE_DIR = Path(os.getenv("OCR_ATENEA_DATA_DIR", "data_cases"))
 BASE_DIR.mkdir(parents=True, exist_ok=True)
 
 
+@lru_cache(maxsize=512)
 def _case_dir(case_id: str) -> Path:
+    """mkdir solo la primera vez por case_id (la ruta es determinística)."""
     d = BASE_DIR / case_id
     d.mkdir(parents=True, exist_ok=True)
     return d
 
 
-# -------- Supabase config --------
-SUPABASE_URL = os.getenv("SUPABASE_URL", "").strip()
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "").strip()
-SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "ocr-atenea").strip()
-
+# -------- Supabase --------
 # Rutas dentro del bucket (estándar recomendado)
 # ocr-atenea/{case_id}/meta/...
 # ocr-atenea/{case_id}/output/...
@@ -37,30 +76,19 @@ def _sb_path(case_id: str, *parts: str) -> str:
     return "/".join([case_id] + safe_parts)
 
 
-def _use_supabase() -> bool:
-    return bool(SUPABASE_URL and SUPABASE_KEY)
+# Se decide una vez al importar (las variables no cambian en caliente)
+_USE_SUPABASE = bool(SUPABASE_URL and SUPABASE_KEY)
 
 
-def _get_supabase_client():
-    """
-    Crea cliente Supabase SOLO si hay variables de entorno.
-    """
-    if not _use_supabase():
-        return None
-    try:
-        from supabase import create_client  # type: ignore
-    except Exception as e:
-        raise RuntimeError(
-            "No se pudo importar supabase. ¿Instalaste `supabase>=2.0.0`?"
-        ) from e
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+def _use_supabase() -> bool:
+    return _USE_SUPABASE
 
 
 def _sb_upload_bytes(path: str, content: bytes, content_type: str = "application/octet-stream") -> None:
     """
     Sube bytes a Supabase Storage. Usa upsert (sobrescribe).
     """
-    sb = _get_supabase_client()
+    sb = get_supabase_client()
     if sb is None:
         raise RuntimeError("Supabase no está configurado (faltan variables SUPABASE_URL/SUPABASE_SERVICE_ROLE_KEY).")
 
@@ -78,24 +106,37 @@ def _sb_upload_bytes(path: str, content: bytes, content_type: str = "application
         raise RuntimeError(f"Supabase upload error: {res.get('error')}")
 
 
+def _sb_es_no_encontrado(e: Exception) -> bool:
+    """Supabase Storage responde 400/404 ("Object not found") para objetos inexistentes."""
+    info = e.args[0] if e.args and isinstance(e.args[0], dict) else {}
+    codigo = str(info.get("statusCode") or getattr(e, "status", "") or getattr(e, "code", ""))
+    return codigo in ("400", "404") or "not found" in str(e).lower()
+
+
 def _sb_download_bytes(path: str) -> bytes:
     """
     Descarga bytes desde Supabase Storage.
     """
-    sb = _get_supabase_client()
+    sb = get_supabase_client()
     if sb is None:
         raise RuntimeError("Supabase no está configurado (faltan variables SUPABASE_URL/SUPABASE_SERVICE_ROLE_KEY).")
 
-    data = sb.storage.from_(SUPABASE_BUCKET).download(path)
+    try:
+        data = sb.storage.from_(SUPABASE_BUCKET).download(path)
+    except Exception as e:
+        # El SDK lanza su propia excepción (StorageException) si el objeto no existe:
+        # se traduce a FileNotFoundError para que los get_* devuelvan None (404 en la API)
+        if _sb_es_no_encontrado(e):
+            raise FileNotFoundError(f"No se encontró el archivo en Supabase: {path}") from e
+        raise
     # Normalmente devuelve bytes
     if data is None:
         raise FileNotFoundError(f"No se encontró el archivo en Supabase: {path}")
     return data
 
 
-def _sb_write_json(path: str, payload: dict) -> None:
-    content = json.dumps(payload, ensure_ascii=False, indent=2, default=str).encode("utf-8")
-    _sb_upload_bytes(path, content, content_type="application/json")
+def _sb_write_json(path: str, payload: dict, indent: bool = True) -> None:
+    _sb_upload_bytes(path, dumps_json(payload, indent=indent), content_type="application/json")
 
 
 def _sb_read_json(path: str) -> Optional[dict]:
@@ -103,73 +144,276 @@ def _sb_read_json(path: str) -> Optional[dict]:
         content = _sb_download_bytes(path)
     except FileNotFoundError:
         return None
-    return json.loads(content.decode("utf-8"))
+    return loads_json(content)
+
+
+# ============================================================
+# 🧠 Cache de lecturas (uploads / status / result)
+# - Supabase: TTL corto (evita un round-trip por cada poll de Streamlit)
+# - Local: se invalida por mtime del archivo (un stat en vez de leer + parsear)
+# - Los save_* de este proceso invalidan su entrada al escribir
+# - Los valores cacheados son compartidos: no modificarlos
+# - LRU acotado (READ_CACHE_MAX_ENTRIES): el TTL solo decide frescura, el tope evita
+#   que cada caso visto quede en memoria toda la vida del proceso
+# ============================================================
+TTL_STATUS_S = 2.0
+TTL_META_S = 60.0
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "256"))
+
+_READ_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+# Las lecturas corren en hilos (asyncio.to_thread): el OrderedDict se toca bajo lock
+_READ_CACHE_LOCK = threading.Lock()
+
+
+def _cache_get(key: tuple) -> Optional[tuple]:
+    with _READ_CACHE_LOCK:
+        hit = _READ_CACHE.get(key)
+        if hit is not None:
+            _READ_CACHE.move_to_end(key)
+        return hit
+
+
+def _cache_put(key: tuple, stamp: Any, val: Any) -> None:
+    with _READ_CACHE_LOCK:
+        _READ_CACHE[key] = (stamp, val)
+        _READ_CACHE.move_to_end(key)
+        while len(_READ_CACHE) > READ_CACHE_MAX_ENTRIES:
+            _READ_CACHE.popitem(last=False)
+
+
+def _sb_cached(kind: str, path: str, ttl: float, loader):
+    key = (kind, path)
+    now = time.monotonic()
+    hit = _cache_get(key)
+    if hit is not None and now - hit[0] < ttl:
+        return hit[1]
+    val = loader()
+    # Ausente no se cachea: el archivo puede aparecer en el siguiente poll
+    if val is not None:
+        _cache_put(key, now, val)
+    return val
+
+
+def _local_cached(kind: str, path: Path, loader):
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = (kind, str(path))
+    hit = _cache_get(key)
+    if hit is not None and hit[0] == mtime:
+        return hit[1]
+    val = loader(path)
+    _cache_put(key, mtime, val)
+    return val
+
+
+def _invalidate(path: str | Path) -> None:
+    with _READ_CACHE_LOCK:
+        for kind in ("json", "bytes"):
+            _READ_CACHE.pop((kind, str(path)), None)
+
+
+def _read_json_file(path: Path) -> Any:
+    return loads_json(path.read_bytes())
+
+
+def _read_bytes_file(path: Path) -> bytes:
+    return path.read_bytes()
 
 
 # ============================================================
 # ✅ API pública que usa tu backend (misma firma que tu piloto)
 # ============================================================
 
-def save_uploads(case_id: str, uploads: List[dict]) -> None:
+# -------- meta.json: uploads + status en un solo objeto --------
+# Un evento ("subido", "procesando", ...) = un solo write (un round-trip a Supabase).
+# Casos anteriores con uploads.json / status.json separados se siguen leyendo.
+def _status_payload(case_id: str, status: str, extra: Optional[dict] = None) -> dict:
+    payload = {"case_id": case_id, "status": status, "ts": time.time()}
+    if extra:
+        payload.update(extra)
+    return payload
+
+
+def _read_json_or_none(case_id: str, sb_parts: tuple, local_name: str, ttl: float) -> Optional[dict]:
+    if _use_supabase():
+        path = _sb_path(case_id, *sb_parts)
+
+        # Objeto ausente -> None (_sb_read_json); caídas/errores de auth se propagan
+        return _sb_cached("json", path, ttl, lambda: _sb_read_json(path))
+
+    # 🧱 Fallback local
+    return _local_cached("json", _case_dir(case_id) / local_name, _read_json_file)
+
+
+def get_case_meta(case_id: str) -> dict:
+    """
+    - Supabase: {case_id}/meta/meta.json
+    - Local: data_cases/{case_id}/meta.json
+    """
+    return _read_json_or_none(case_id, ("meta", "meta.json"), "meta.json", TTL_STATUS_S) or {}
+
+
+def _read_case_meta_fresh(case_id: str) -> dict:
+    """meta.json sin pasar por el cache: base del read-modify-write de save_case_meta."""
+    if _use_supabase():
+        return _sb_read_json(_sb_path(case_id, "meta", "meta.json")) or {}
+
+    # 🧱 Fallback local
+    p = _case_dir(case_id) / "meta.json"
+    try:
+        return _read_json_file(p)
+    except FileNotFoundError:
+        return {}
+
+
+def save_case_meta(case_id: str, patch: dict, merge: bool = True) -> None:
+    """
+    Escribe meta.json una vez; merge=True combina con lo guardado.
+    El merge lee sin cache: con varios workers/procesos una copia cacheada (hasta
+    TTL_STATUS_S de vieja) haría perder claves (status/uploads) escritas por otro.
+    """
+    payload = {**_read_case_meta_fresh(case_id), **patch} if merge else dict(patch)
+    payload["case_id"] = case_id
+
+    if _use_supabase():
+        path = _sb_path(case_id, "meta", "meta.json")
+        _sb_write_json(path, payload)
+        # Lo recién escrito es lo más fresco que hay: queda como entrada del cache
+        _cache_put(("json", path), time.monotonic(), payload)
+        return
+
+    # 🧱 Fallback local
+    meta_path = _case_dir(case_id) / "meta.json"
+    meta_path.write_bytes(dumps_json(payload))
+    _invalidate(meta_path)
+
+
+def save_uploads(
+    case_id: str,
+    uploads: List[dict],
+    status: Optional[str] = None,
+    status_extra: Optional[dict] = None,
+) -> None:
     """
     uploads: list of {original_name, saved_path, size_bytes, content_type}
-    - En modo Supabase: guarda meta en {case_id}/meta/uploads.json
-    - En modo local: guarda en data_cases/{case_id}/uploads.json (igual que antes)
+    Guarda en meta.json; si viene status, va en el mismo write (sin save_status aparte).
     """
-    payload = {"case_id": case_id, "uploads": uploads}
+    patch: Dict[str, Any] = {"uploads": uploads}
+    if status:
+        patch["status"] = _status_payload(case_id, status, status_extra)
+    save_case_meta(case_id, patch, merge=False)
+
+
+# -------- Uploads de a un archivo (/upload_one): un objeto por archivo --------
+# {case_id}/meta/uploads/{idx:04d}.json (local: data_cases/{case_id}/uploads/{idx:04d}.json)
+# Cada request escribe solo su objeto: sin read-modify-write de meta.json, así que subidas
+# concurrentes (aunque caigan en workers distintos) no se pisan. Un reintento del mismo idx
+# sobrescribe su propio objeto.
+UPLOAD_ENTRIES_LIST_LIMIT = 1000
+
+
+def _upload_entry_name(idx: int) -> str:
+    return f"{idx:04d}.json"
+
 
+def save_upload_entry(case_id: str, idx: int, upload: dict) -> None:
     if _use_supabase():
-        _sb_write_json(_sb_path(case_id, "meta", "uploads.json"), payload)
+        _sb_write_json(_sb_path(case_id, "meta", "uploads", _upload_entry_name(idx)), upload)
         return
 
     # 🧱 Fallback local
-    d = _case_dir(case_id)
-    meta_path = d / "uploads.json"
-    meta_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    d = _case_dir(case_id) / "uploads"
+    d.mkdir(exist_ok=True)
+    (d / _upload_entry_name(idx)).write_bytes(dumps_json(upload))
 
 
-def get_uploads(case_id: str) -> List[dict]:
+def _list_upload_entries(case_id: str) -> List[dict]:
+    """Sin cache: se lee al procesar, cuando ya terminaron todas las subidas. Orden = idx."""
     if _use_supabase():
-        data = _sb_read_json(_sb_path(case_id, "meta", "uploads.json"))
-        if not data:
+        folder = _sb_path(case_id, "meta", "uploads")
+        # Carpeta inexistente -> lista vacía; un error de red no debe pasar por "sin uploads"
+        listed = get_supabase_client().storage.from_(SUPABASE_BUCKET).list(
+            folder, {"limit": UPLOAD_ENTRIES_LIST_LIMIT}
+        )
+        names = sorted(o["name"] for o in (listed or []) if str(o.get("name", "")).endswith(".json"))
+        if not names:
             return []
-        return data.get("uploads", [])
+        with ThreadPoolExecutor(max_workers=min(8, len(names))) as ex:
+            contents = list(ex.map(lambda n: _sb_download_bytes(f"{folder}/{n}"), names))
+        return [loads_json(c) for c in contents]
 
     # 🧱 Fallback local
-    d = _case_dir(case_id)
-    meta_path = d / "uploads.json"
-    if not meta_path.exists():
+    d = _case_dir(case_id) / "uploads"
+    if not d.is_dir():
         return []
-    data = json.loads(meta_path.read_text(encoding="utf-8"))
-    return data.get("uploads", [])
+    return [loads_json(p.read_bytes()) for p in sorted(d.glob("*.json"))]
+
+
+def get_uploads(case_id: str) -> List[dict]:
+    """Uploads de /upload (meta.json) + los subidos de a uno con /upload_one."""
+    entries = _list_upload_entries(case_id)
+    meta = get_case_meta(case_id)
+    if "uploads" in meta:
+        uploads = meta["uploads"]
+    elif entries:
+        # Caso de /upload_one: nunca tuvo uploads.json (sin ese round-trip extra a Supabase)
+        uploads = []
+    else:
+        # Casos anteriores: {case_id}/meta/uploads.json (local: uploads.json)
+        data = _read_json_or_none(case_id, ("meta", "uploads.json"), "uploads.json", TTL_META_S)
+        uploads = (data or {}).get("uploads", [])
+    return [*uploads, *entries]
 
 
 def save_result(case_id: str, result: Dict[str, Any]) -> None:
     """
     result: dict (idealmente sin excel bytes binarios)
+    JSON compacto (sin indentación): es el archivo grande (df_master + logs) y se sirve tal cual.
     - Supabase: {case_id}/output/result.json
     - Local: data_cases/{case_id}/result.json
     """
     if _use_supabase():
-        _sb_write_json(_sb_path(case_id, "output", "result.json"), result)
+        path = _sb_path(case_id, "output", "result.json")
+        _sb_write_json(path, result, indent=False)
+        _invalidate(path)
         return
 
     # 🧱 Fallback local
     d = _case_dir(case_id)
     out_path = d / "result.json"
-    out_path.write_text(json.dumps(result, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+    out_path.write_bytes(dumps_json(result, indent=False))
+    _invalidate(out_path)
 
 
 def get_result(case_id: str) -> Optional[Dict[str, Any]]:
     if _use_supabase():
-        return _sb_read_json(_sb_path(case_id, "output", "result.json"))
+        path = _sb_path(case_id, "output", "result.json")
+        return _sb_cached("json", path, TTL_META_S, lambda: _sb_read_json(path))
 
     # 🧱 Fallback local
     d = _case_dir(case_id)
-    out_path = d / "result.json"
-    if not out_path.exists():
-        return None
-    return json.loads(out_path.read_text(encoding="utf-8"))
+    return _local_cached("json", d / "result.json", _read_json_file)
+
+
+def get_result_bytes(case_id: str) -> Optional[bytes]:
+    """result.json tal cual está guardado (para devolverlo sin parsear ni re-serializar)."""
+    if _use_supabase():
+        path = _sb_path(case_id, "output", "result.json")
+
+        def _load() -> Optional[bytes]:
+            try:
+                return _sb_download_bytes(path)
+            except FileNotFoundError:
+                # Solo objeto ausente -> None (404 en /results); una caída de Supabase es 5xx
+                return None
+
+        return _sb_cached("bytes", path, TTL_META_S, _load)
+
+    # 🧱 Fallback local
+    d = _case_dir(case_id)
+    return _local_cached("bytes", d / "result.json", _read_bytes_file)
 
 
 def save_excel(case_id: str, excel_bytes: bytes) -> None:
@@ -188,6 +432,16 @@ def save_excel(case_id: str, excel_bytes: bytes) -> None:
     xls_path.write_bytes(excel_bytes)
 
 
+def get_excel_local_path(case_id: str) -> Optional[Path]:
+    """
+    Path del Excel en modo local (para servirlo con sendfile, sin leerlo a memoria).
+    En modo Supabase devuelve None: el Excel está en el bucket ({case_id}/output/output.xlsx).
+    """
+    if _use_supabase():
+        return None
+    return _case_dir(case_id) / "output.xlsx"
+
+
 def get_excel(case_id: str) -> Optional[bytes]:
     if _use_supabase():
         try:
@@ -203,35 +457,105 @@ def get_excel(case_id: str) -> Optional[bytes]:
     return xls_path.read_bytes()
 
 
+def copy_excel(src_case_id: str, dst_case_id: str) -> bool:
+    """
+    Copia el Excel de un caso a otro sin pasarlo por memoria del proceso.
+    - Supabase: copia del lado del servidor (storage copy); si falla (p. ej. el destino
+      ya existe), se cae a descargar + subir.
+    - Local: shutil.copyfile.
+    False si el caso origen no tiene Excel.
+    """
+    if _use_supabase():
+        src = _sb_path(src_case_id, "output", "output.xlsx")
+        dst = _sb_path(dst_case_id, "output", "output.xlsx")
+        try:
+            get_supabase_client().storage.from_(SUPABASE_BUCKET).copy(src, dst)
+            return True
+        except Exception:
+            excel_bytes = get_excel(src_case_id)
+            if not excel_bytes:
+                return False
+            save_excel(dst_case_id, excel_bytes)
+            return True
+
+    # 🧱 Fallback local
+    src_path = _case_dir(src_case_id) / "output.xlsx"
+    if not src_path.exists():
+        return False
+    shutil.copyfile(src_path, _case_dir(dst_case_id) / "output.xlsx")
+    return True
+
+
 def save_status(case_id: str, status: str, extra: Optional[dict] = None) -> None:
+    """Guarda el estado dentro de meta.json (clave "status")."""
+    save_case_meta(case_id, {"status": _status_payload(case_id, status, extra)})
+
+
+def get_status(case_id: str) -> dict:
+    data = get_case_meta(case_id).get("status")
+    if not data:
+        # Casos anteriores: {case_id}/status/status.json (local: status.json)
+        data = _read_json_or_none(case_id, ("status", "status.json"), "status.json", TTL_STATUS_S)
+    if not data:
+        return {"case_id": case_id, "status": "not_found"}
+    return data
+
+
+def save_case_by_hash(content_hash: str, case_id: str) -> None:
     """
-    - Supabase: {case_id}/status/status.json
-    - Local: data_cases/{case_id}/status.json
+    Índice contenido -> case_id (hash combinado de los archivos del caso).
+    - Supabase: _by_hash/{hash}.json
+    - Local: data_cases/_by_hash/{hash}.json
     """
-    payload = {"case_id": case_id, "status": status, "ts": time.time()}
-    if extra:
-        payload.update(extra)
+    payload = {"case_id": case_id, "ts": time.time()}
 
     if _use_supabase():
-        _sb_write_json(_sb_path(case_id, "status", "status.json"), payload)
+        _sb_write_json(_sb_path("_by_hash", f"{content_hash}.json"), payload)
         return
 
     # 🧱 Fallback local
-    d = _case_dir(case_id)
-    s_path = d / "status.json"
-    s_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    d = _case_dir("_by_hash")
+    (d / f"{content_hash}.json").write_bytes(dumps_json(payload))
 
 
-def get_status(case_id: str) -> dict:
+def save_file_by_hash(sha256: str, upload: dict) -> None:
+    """
+    Índice sha256 de un archivo -> su entrada de upload (storage_path, content_type, ...).
+    Permite registrar el mismo contenido en otro caso sin volver a recibir los bytes.
+    - Supabase: _by_file/{sha256}.json
+    - Local: data_cases/_by_file/{sha256}.json
+    """
+    payload = {**upload, "ts": time.time()}
+
     if _use_supabase():
-        data = _sb_read_json(_sb_path(case_id, "status", "status.json"))
-        if not data:
-            return {"case_id": case_id, "status": "not_found"}
-        return data
+        _sb_write_json(_sb_path("_by_file", f"{sha256}.json"), payload)
+        return
 
     # 🧱 Fallback local
-    d = _case_dir(case_id)
-    s_path = d / "status.json"
-    if not s_path.exists():
-        return {"case_id": case_id, "status": "not_found"}
-    return json.loads(s_path.read_text(encoding="utf-8"))
+    d = _case_dir("_by_file")
+    (d / f"{sha256}.json").write_bytes(dumps_json(payload))
+
+
+def get_file_by_hash(sha256: str) -> Optional[dict]:
+    if _use_supabase():
+        # No existe en el bucket -> None; cualquier otro error se propaga
+        return _sb_read_json(_sb_path("_by_file", f"{sha256}.json"))
+
+    # 🧱 Fallback local
+    p = _case_dir("_by_file") / f"{sha256}.json"
+    if not p.exists():
+        return None
+    return loads_json(p.read_bytes())
+
+
+def get_case_by_hash(content_hash: str) -> Optional[str]:
+    if _use_supabase():
+        # No existe en el bucket -> None; cualquier otro error se propaga
+        data = _sb_read_json(_sb_path("_by_hash", f"{content_hash}.json"))
+    else:
+        # 🧱 Fallback local
+        p = _case_dir("_by_hash") / f"{content_hash}.json"
+        if not p.exists():
+            return None
+        data = loads_json(p.read_bytes())
+    return (data or {}).get("case_id")
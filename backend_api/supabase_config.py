@@ -1,33 +1,53 @@
 import os
-from supabase import create_client
+from functools import lru_cache
+from typing import Optional
 
 # (Opcional pero recomendado si usas backend_api/.env en local)
+# Se carga al importar este módulo: storage.py y main.py leen de aquí su configuración.
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except Exception:
     pass
 
+# supabase se importa al cargar el módulo (no en la primera request); es opcional en modo local
+try:
+    from supabase import create_client  # type: ignore
+    _SUPABASE_IMPORT_ERROR: Optional[Exception] = None
+except Exception as e:  # pragma: no cover
+    create_client = None
+    _SUPABASE_IMPORT_ERROR = e
+
 SUPABASE_URL = (os.getenv("SUPABASE_URL") or "").strip()
 SUPABASE_KEY = (os.getenv("SUPABASE_SERVICE_ROLE_KEY") or "").strip()
 BUCKET = (os.getenv("SUPABASE_BUCKET") or "ocr-atenea").strip()
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError(
-        "Faltan variables de entorno de Supabase. "
-        "Asegura SUPABASE_URL y SUPABASE_SERVICE_ROLE_KEY en tu .env o en el servidor."
-    )
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+def supabase_configurado() -> bool:
+    return bool(SUPABASE_URL and SUPABASE_KEY)
+
 
-def upload_bytes(path: str, content: bytes, content_type: str = "application/octet-stream"):
+@lru_cache(maxsize=1)
+def get_supabase_client():
     """
-    path ejemplo:
-    {case_id}/input/RUT.pdf
-    {case_id}/output/result.xlsx
+    Crea cliente Supabase SOLO si hay variables de entorno (None si no: storage usa disco local).
+    Uno por proceso, compartido por storage.py y main.py: se reusa su sesión HTTP (keep-alive).
     """
-    return supabase.storage.from_(BUCKET).upload(
-        path=path,
-        file=content,
-        file_options={"content-type": content_type, "upsert": "true"},
-    )
+    if not supabase_configurado():
+        return None
+    if _SUPABASE_IMPORT_ERROR is not None:
+        raise RuntimeError(
+            "No se pudo importar supabase. ¿Instalaste `supabase>=2.0.0`?"
+        ) from _SUPABASE_IMPORT_ERROR
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+def require_supabase_client():
+    """Igual que get_supabase_client, pero sin variables falla (los inputs de main.py viven en el bucket)."""
+    sb = get_supabase_client()
+    if sb is None:
+        raise RuntimeError(
+            "Faltan variables de entorno de Supabase. "
+            "Asegura SUPABASE_URL y SUPABASE_SERVICE_ROLE_KEY en tu .env o en el servidor."
+        )
+    return sb
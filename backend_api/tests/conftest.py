@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# storage lee estas variables al importarse: se fijan antes de cualquier import.
+# Los tests nunca tocan Supabase ni el data_cases real.
+os.environ["OCR_ATENEA_DATA_DIR"] = tempfile.mkdtemp(prefix="ocr_atenea_tests_")
+os.environ["SUPABASE_URL"] = ""
+os.environ["SUPABASE_SERVICE_ROLE_KEY"] = ""
+
+# Los módulos del backend se importan como top-level (igual que en main.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,159 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("openai")
+
+import core_extractor as ce  # noqa: E402
+
+
+# =========================
+# 🔢 only_digits
+# =========================
+@pytest.mark.parametrize(
+    "raw,esperado",
+    [
+        ("1.020.304.050", "1020304050"),
+        ("NIT 800-244 627", "800244627"),
+        (1020304050, "1020304050"),
+        ("\u0661\u0662\u0663", "\u0661\u0662\u0663"),  # dígitos Unicode: mismo criterio que \d
+        ("sin números", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_only_digits(raw, esperado):
+    assert ce.only_digits(raw) == esperado
+
+
+# =========================
+# 🧹 limpiar_texto_para_llm
+# =========================
+@pytest.mark.parametrize("raw", ["", None])
+def test_limpiar_texto_vacio(raw):
+    assert ce.limpiar_texto_para_llm(raw) == ""
+
+
+def test_limpiar_texto_quita_caracteres_de_control():
+    assert ce.limpiar_texto_para_llm("NIT\x00 800\x07244\x1b627") == "NIT 800244627"
+
+
+def test_limpiar_texto_conserva_salto_simple():
+    assert ce.limpiar_texto_para_llm("a\nb") == "a\nb"
+
+
+def test_limpiar_texto_compacta_espacios_y_saltos():
+    raw = "  Banco \t  Davivienda\n\n\n\n\nCuenta  123  "
+    assert ce.limpiar_texto_para_llm(raw) == "Banco Davivienda\n\nCuenta 123"
+
+
+def test_limpiar_texto_normaliza_nfkc():
+    # Ligadura "ﬁ" -> "fi"
+    assert ce.limpiar_texto_para_llm("Certiﬁcación") == "Certificación"
+
+
+@pytest.mark.parametrize(
+    "raw,esperado",
+    [
+        ("Banco\u00a0Davivienda", "Banco Davivienda"),  # NBSP -> espacio
+        ("800\u200b244", "800244"),                     # zero-width space
+        ("\u200eCuenta\u200f 123", "Cuenta 123"),       # marcas LRM / RLM
+        ("NIT 800\u00a0\u00a0244", "NIT 800 244"),      # se compactan tras el reemplazo
+    ],
+)
+def test_limpiar_texto_espacios_raros(raw, esperado):
+    assert ce.limpiar_texto_para_llm(raw) == esperado
+
+
+# =========================
+# 🧾 safe_json_loads
+# =========================
+@pytest.mark.parametrize(
+    "raw",
+    [
+        '{"a": 1}',
+        '  {"a": 1}\n',
+        '```json\n{"a": 1}\n```',
+        '```\n{"a": 1}\n```',
+        '```json{"a": 1}```',
+    ],
+)
+def test_safe_json_loads_vallas(raw):
+    assert ce.safe_json_loads(raw) == {"a": 1}
+
+
+def test_safe_json_loads_conserva_tildes():
+    assert ce.safe_json_loads('{"titular": "Peña Núñez"}') == {"titular": "Peña Núñez"}
+
+
+@pytest.mark.parametrize("raw", ['{"a": 1,}', '```json\n{"a": 1,}\n```'])
+def test_safe_json_loads_coma_final(raw):
+    assert ce.safe_json_loads(raw) == {"a": 1}
+
+
+def test_safe_json_loads_coma_final_en_lista():
+    assert ce.safe_json_loads('{"a": [1, 2,], "b": "x",}') == {"a": [1, 2], "b": "x"}
+
+
+def test_safe_json_loads_nan_cae_a_json_estandar():
+    # orjson (si está instalado) rechaza NaN; json estándar lo acepta
+    data = ce.safe_json_loads('{"a": NaN}')
+    assert data["a"] != data["a"]
+
+
+def test_safe_json_loads_invalido_lanza():
+    with pytest.raises(ValueError):
+        ce.safe_json_loads("no es json")
+
+
+# =========================
+# 🏦 extraer_numero_cuenta_regla
+# =========================
+@pytest.mark.parametrize(
+    "texto,esperado",
+    [
+        ("No. Cuenta: 123-456789-01", "12345678901"),
+        ("N° CUENTA 0012 3456 78", "0012345678"),
+        ("Cuenta de Inversión 987654321", "987654321"),
+        ("CUENTA DE INVERSION: 55-44-33-22", "55443322"),
+        ("cuenta - 4567890", "4567890"),
+    ],
+)
+def test_extraer_numero_cuenta(texto, esperado):
+    assert ce.extraer_numero_cuenta_regla(texto) == esperado
+
+
+def test_extraer_numero_cuenta_sin_cuenta():
+    assert ce.extraer_numero_cuenta_regla("Certificamos que el cliente tiene productos") is None
+
+
+def test_extraer_numero_cuenta_salta_candidatos_cortos():
+    # El primer candidato tiene < 6 dígitos: se toma el siguiente válido
+    assert ce.extraer_numero_cuenta_regla("Cuenta 12-34 --- y Cuenta 55566677") == "55566677"
+
+
+# =========================
+# 🔎 guess_doc_id_by_filename
+# =========================
+@pytest.mark.parametrize(
+    "nombre,esperado",
+    [
+        ("RUT_empresa.pdf", "DOC14"),
+        ("doc14.pdf", "DOC14"),
+        ("cedula_representante.pdf", "DOC12"),
+        ("DocumentoIdentificacion.pdf", "DOC12"),
+        ("doc12.pdf", "DOC12"),
+        ("certificacion_bancaria.pdf", "DOC16"),
+        ("Bancaria.PDF", "DOC16"),
+        ("doc16.pdf", "DOC16"),
+        ("factura.pdf", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_guess_doc_id_by_filename(nombre, esperado):
+    assert ce.guess_doc_id_by_filename(nombre) == esperado
+
+
+def test_guess_doc_id_prioridad():
+    # Coincide con RUT y con CED: gana DOC14 (primero en _DOC_ID_KEYWORDS)
+    assert ce.guess_doc_id_by_filename("rut_y_cedula.pdf") == "DOC14"
@@ -0,0 +1,54 @@
+import os
+import time
+
+import pytest
+
+import llm_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    return tmp_path
+
+
+def _envejecer(key: str, segundos: float) -> None:
+    t = time.time() - segundos
+    os.utime(llm_cache._key_path(key), (t, t))
+
+
+def test_put_get(cache):
+    key = llm_cache.make_key("modelo", "1", "prompt")
+    llm_cache.put(key, '{"a": 1}')
+    assert llm_cache.get(key) == '{"a": 1}'
+
+
+def test_desactivado_no_escribe(cache, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", False)
+    key = llm_cache.make_key("modelo", "1", "prompt")
+    llm_cache.put(key, '{"a": 1}')
+    assert llm_cache.get(key) is None
+    assert not list(cache.glob("*/*.json"))
+
+
+def test_entrada_expirada_se_borra(cache, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_TTL_S", 60)
+    key = llm_cache.make_key("modelo", "1", "prompt")
+    llm_cache.put(key, '{"a": 1}')
+    _envejecer(key, 120)
+
+    assert llm_cache.get(key) is None
+    assert not llm_cache._key_path(key).exists()
+
+
+def test_prune_respeta_el_tope(cache, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_FILES", 2)
+    keys = [llm_cache.make_key("modelo", "1", str(i)) for i in range(4)]
+    for edad, key in zip((40, 30, 20, 10), keys):
+        llm_cache.put(key, "{}")
+        _envejecer(key, edad)
+
+    assert llm_cache.prune() == 2
+    # Quedan las dos más nuevas
+    assert [llm_cache._key_path(k).exists() for k in keys] == [False, False, True, True]
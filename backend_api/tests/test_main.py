@@ -0,0 +1,246 @@
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("numpy")
+pytest.importorskip("openai")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+import storage  # noqa: E402
+from core_extractor import DocItem  # noqa: E402
+
+# =========================
+# 🧪 API con storage local y pipeline falso (sin Supabase, OCR ni OpenAI)
+# =========================
+SHA_RUT = "a" * 64
+SHA_CC = "b" * 64
+
+
+class PipelineFalso:
+    def __init__(self):
+        self.llamadas = []
+        self.error = None
+
+    async def __call__(self, items, client):
+        self.llamadas.append([it.original_name for it in items])
+        if self.error:
+            raise self.error
+        return {"df_master": [], "logs": [], "excel_bytes": b"xlsx"}
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_USE_SUPABASE", False)
+    monkeypatch.setattr(storage, "BASE_DIR", tmp_path)
+    storage._case_dir.cache_clear()
+
+    async def _download_items(case_id, uploads):
+        return [DocItem(path=u["saved_name"], original_name=u["saved_name"]) for u in uploads]
+
+    fake = PipelineFalso()
+    monkeypatch.setattr(main, "_download_items", _download_items)
+    monkeypatch.setattr(main, "run_pipeline", fake)
+    monkeypatch.setattr(main, "get_openai_client", lambda: object())
+    monkeypatch.setattr(main, "PIPELINE_PROCESSES", 0)
+    yield fake
+    storage._case_dir.cache_clear()
+
+
+@pytest.fixture
+def api():
+    # Sin "with": no corren los hooks de startup (Supabase / warmup de EasyOCR)
+    return TestClient(main.app)
+
+
+def _crear_caso(case_id: str, archivos=(("rut.pdf", SHA_RUT), ("cedula.pdf", SHA_CC))) -> str:
+    for idx, (nombre, sha) in enumerate(archivos):
+        storage.save_upload_entry(case_id, idx, {"saved_name": nombre, "sha256": sha})
+    storage.save_status(case_id, "uploaded")
+    return case_id
+
+
+def _status_con_edad(case_id: str, status: str, edad_s: float) -> None:
+    payload = {"case_id": case_id, "status": status, "ts": time.time() - edad_s}
+    storage.save_case_meta(case_id, {"status": payload})
+
+
+# =========================
+# 🧠 /process
+# =========================
+def test_process_sin_uploads_es_404(pipeline, api):
+    assert api.post("/process/noexiste").status_code == 404
+    assert pipeline.llamadas == []
+
+
+def test_process_sincrono(pipeline, api):
+    case_id = _crear_caso("casoa")
+
+    resp = api.post(f"/process/{case_id}")
+
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "processed"
+    assert resp.json()["excel_path"] == f"{case_id}/output/output.xlsx"
+    assert pipeline.llamadas == [["rut.pdf", "cedula.pdf"]]
+    assert storage.get_result(case_id) == {"df_master": [], "logs": []}
+    assert storage.get_excel(case_id) == b"xlsx"
+
+
+def test_process_en_segundo_plano(pipeline, api):
+    case_id = _crear_caso("casob")
+
+    resp = api.post(f"/process/{case_id}", params={"background": "true"})
+
+    assert resp.status_code == 202
+    assert resp.json()["status"] == "queued"
+    # TestClient corre las BackgroundTasks antes de devolver la respuesta
+    assert pipeline.llamadas == [["rut.pdf", "cedula.pdf"]]
+    assert api.get(f"/process/{case_id}/status").json()["status"] == "processed"
+
+
+def test_process_en_segundo_plano_registra_error(pipeline, api):
+    case_id = _crear_caso("casoc")
+    pipeline.error = RuntimeError("OCR caído")
+
+    api.post(f"/process/{case_id}", params={"background": "true"})
+
+    status = api.get(f"/process/{case_id}/status").json()
+    assert status["status"] == "error"
+    assert status["detail"] == "OCR caído"
+
+
+@pytest.mark.parametrize("en_curso", ["queued", "processing"])
+def test_process_en_curso_sincrono_es_409(pipeline, api, en_curso):
+    case_id = _crear_caso("casod")
+    _status_con_edad(case_id, en_curso, 5)
+
+    resp = api.post(f"/process/{case_id}")
+
+    assert resp.status_code == 409
+    assert pipeline.llamadas == []
+
+
+def test_process_en_curso_en_segundo_plano_es_202_sin_reencolar(pipeline, api):
+    case_id = _crear_caso("casoe")
+    _status_con_edad(case_id, "processing", 5)
+
+    resp = api.post(f"/process/{case_id}", params={"background": "true"})
+
+    assert resp.status_code == 202
+    assert resp.json()["status"] == "processing"
+    assert pipeline.llamadas == []
+    assert api.get(f"/process/{case_id}/status").json()["status"] == "processing"
+
+
+def test_process_estado_abandonado_se_reprocesa(pipeline, api, monkeypatch):
+    monkeypatch.setattr(main, "PROCESS_STALE_S", 60)
+    case_id = _crear_caso("casof")
+    _status_con_edad(case_id, "processing", 120)
+
+    resp = api.post(f"/process/{case_id}", params={"background": "true"})
+
+    assert resp.status_code == 202
+    assert resp.json()["status"] == "queued"
+    assert len(pipeline.llamadas) == 1
+
+
+# =========================
+# ♻️ Reutilización de un resultado previo (_by_hash)
+# =========================
+def test_mismos_archivos_reusan_el_resultado(pipeline, api):
+    original = _crear_caso("casog")
+    api.post(f"/process/{original}")
+
+    copia = _crear_caso("casoh")
+    resp = api.post(f"/process/{copia}")
+
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "processed"
+    assert len(pipeline.llamadas) == 1  # el segundo caso no corre el pipeline
+    assert storage.get_result(copia)["reutilizado_de_case_id"] == original
+    assert storage.get_excel(copia) == b"xlsx"
+
+
+def test_otro_nombre_no_reusa(pipeline, api):
+    # El pipeline clasifica por nombre: mismo contenido con otro nombre no es el mismo caso
+    api.post(f"/process/{_crear_caso('casoi')}")
+    otro = _crear_caso("casoj", archivos=(("rut_2024.pdf", SHA_RUT), ("cedula.pdf", SHA_CC)))
+
+    api.post(f"/process/{otro}")
+
+    assert len(pipeline.llamadas) == 2
+    assert "reutilizado_de_case_id" not in storage.get_result(otro)
+
+
+def test_force_reprocesa_aunque_haya_resultado_previo(pipeline, api):
+    api.post(f"/process/{_crear_caso('casok')}")
+    copia = _crear_caso("casol")
+
+    resp = api.post(f"/process/{copia}", params={"force": "true"})
+
+    assert resp.status_code == 200
+    assert len(pipeline.llamadas) == 2
+    assert "reutilizado_de_case_id" not in storage.get_result(copia)
+
+
+def test_uploads_sin_sha256_no_reusan(pipeline, api):
+    # Casos anteriores al registro del sha256: sin hash combinado no hay atajo
+    archivos = (("rut.pdf", None),)
+    api.post(f"/process/{_crear_caso('casom', archivos)}")
+    api.post(f"/process/{_crear_caso('cason', archivos)}")
+
+    assert len(pipeline.llamadas) == 2
+
+
+def test_falla_del_atajo_procesa_normal(pipeline, api, monkeypatch):
+    api.post(f"/process/{_crear_caso('casoo')}")
+    copia = _crear_caso("casop")
+
+    def _caido(content_hash):
+        raise ConnectionError("supabase caído")
+
+    monkeypatch.setattr(main, "get_case_by_hash", _caido)
+    resp = api.post(f"/process/{copia}")
+
+    assert resp.status_code == 200
+    assert len(pipeline.llamadas) == 2
+
+
+# =========================
+# 📤 /upload_one y /upload_known: idx acotado
+# =========================
+@pytest.fixture
+def bucket_falso(pipeline, monkeypatch):
+    subidos = []
+    monkeypatch.setattr(main, "_upload_path_to_supabase", lambda path, tmp, ct: subidos.append(path))
+    monkeypatch.setattr(main, "_copy_storage_object", lambda src, dst, ct: subidos.append(dst))
+    return subidos
+
+
+@pytest.mark.parametrize("idx", [-1, main.MAX_FILES_PER_CASE])
+def test_upload_one_idx_fuera_de_rango_es_422(bucket_falso, api, idx):
+    resp = api.post("/upload_one", params={"idx": idx}, files={"file": ("rut.pdf", b"%PDF", "application/pdf")})
+
+    assert resp.status_code == 422
+    assert bucket_falso == []
+
+
+@pytest.mark.parametrize("idx", [-1, main.MAX_FILES_PER_CASE])
+def test_upload_known_idx_fuera_de_rango_es_422(bucket_falso, api, idx):
+    resp = api.post("/upload_known", params={"sha256": SHA_RUT, "filename": "rut.pdf", "idx": idx})
+
+    assert resp.status_code == 422
+    assert bucket_falso == []
+
+
+def test_upload_one_ultimo_idx_valido(bucket_falso, api):
+    idx = main.MAX_FILES_PER_CASE - 1
+
+    resp = api.post("/upload_one", params={"idx": idx}, files={"file": ("rut.pdf", b"%PDF", "application/pdf")})
+
+    assert resp.status_code == 200
+    case_id = resp.json()["case_id"]
+    assert bucket_falso == [f"{case_id}/input/{idx}_rut.pdf"]
+    assert [u["saved_name"] for u in storage.get_uploads(case_id)] == ["rut.pdf"]
@@ -0,0 +1,186 @@
+import asyncio
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("openai")
+
+import core_extractor as ce  # noqa: E402
+import llm_cache  # noqa: E402
+
+# =========================
+# 🧪 Dobles: PDF/OCR sin fitz ni EasyOCR, OpenAI sin red
+# =========================
+TEXTO_RUT = "FORMULARIO DEL REGISTRO ÚNICO TRIBUTARIO " * 5
+TEXTO_CC = "REPUBLICA DE COLOMBIA CEDULA DE CIUDADANIA 1.020.304.050"
+TEXTO_DOC16 = "BANCOLOMBIA certifica que el titular tiene la Cuenta 123-456789-01 ACTIVA"
+
+DATOS_RUT = {"primer_apellido": " PEREZ ", "primer_nombre": "ANA", "numero_identificacion": None}
+DATOS_CC = {"doc_numero": "1.020.304.050", "doc_apellidos": "PEREZ", "doc_nombres": "ANA"}
+DATOS_DOC16 = {"banco_nombre": "Bancolombia", "numero_cuenta": "123-456789-01"}
+
+
+def _tipo_prompt(prompt: str) -> str:
+    if "<<<" in prompt:
+        return "lote"
+    if "RUT DIAN" in prompt:
+        return "rut"
+    if "CÉDULA DE CIUDADANÍA" in prompt:
+        return "cc"
+    return "doc16"
+
+
+class FakeAsyncOpenAI:
+    """
+    Sustituto de AsyncOpenAI: responde según el tipo de prompt (lote / rut / cc / doc16).
+    Cada respuesta es un dict (se serializa a JSON) o una excepción (se lanza).
+    """
+    def __init__(self, respuestas: dict):
+        self.respuestas = respuestas
+        self.llamadas: list = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, *, messages, **kwargs):
+        tipo = _tipo_prompt(messages[-1]["content"])
+        self.llamadas.append(tipo)
+        r = self.respuestas[tipo]
+        if isinstance(r, Exception):
+            raise r
+        msg = SimpleNamespace(content=json.dumps(r))
+        return SimpleNamespace(choices=[SimpleNamespace(message=msg)])
+
+
+@pytest.fixture
+def pdf_falso(monkeypatch):
+    """El path del DocItem es la clave del texto/error que "contiene" el PDF."""
+    textos = {"rut.pdf": TEXTO_RUT, "cedula.pdf": TEXTO_CC, "certificacion_bancaria.pdf": TEXTO_DOC16}
+    fallos: dict = {}
+
+    @contextmanager
+    def _pdf_doc(pdf, doc=None):
+        if pdf in fallos:
+            raise fallos[pdf]
+        yield pdf if doc is None else doc
+
+    monkeypatch.setattr(ce, "_pdf_doc", _pdf_doc)
+    monkeypatch.setattr(ce, "extract_text_pymupdf", lambda _b, doc=None, **kw: textos[doc])
+    monkeypatch.setattr(ce, "pdf_to_images_pymupdf", lambda _b, doc=None, **kw: [textos[doc]])
+    monkeypatch.setattr(ce, "ocr_images_easyocr", lambda images: "\n".join(images))
+    monkeypatch.setattr(ce, "extract_doc16_text", lambda _b, doc=None: textos[doc])
+    monkeypatch.setattr(ce, "ocr_numero_identificacion_desde_campo26", lambda _b, doc=None: None)
+    monkeypatch.setattr(ce, "records_to_excel_bytes", lambda records: b"xlsx")
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", False)
+    return fallos
+
+
+def _items(*nombres):
+    return [ce.DocItem(path=n, original_name=n) for n in nombres]
+
+
+TRES_DOCS = ("rut.pdf", "cedula.pdf", "certificacion_bancaria.pdf")
+
+
+def _run(items, client):
+    return asyncio.run(ce.run_pipeline(items, client))
+
+
+def _errores(result, tipo="ERROR"):
+    return [(l["documento"], l["mensaje"]) for l in result["logs"] if l["tipo"] == tipo]
+
+
+# =========================
+# 🧩 Llamada IA en lote
+# =========================
+def test_tres_documentos_una_sola_llamada(pdf_falso):
+    client = FakeAsyncOpenAI({"lote": {"rut": DATOS_RUT, "cc": DATOS_CC, "doc16": DATOS_DOC16}})
+
+    result = _run(_items(*TRES_DOCS), client)
+
+    assert client.llamadas == ["lote"]
+    assert result["rut_data"]["primer_apellido"] == "PEREZ"
+    assert result["cc_data"]["doc_numero"] == "1020304050"
+    assert result["doc16_data"]["numero_cuenta"] == "12345678901"
+    assert result["excel_bytes"] == b"xlsx"
+    assert _errores(result) == []
+
+
+def test_un_documento_no_usa_lote(pdf_falso):
+    client = FakeAsyncOpenAI({"rut": DATOS_RUT})
+
+    result = _run(_items("rut.pdf"), client)
+
+    assert client.llamadas == ["rut"]
+    assert result["rut_data"]["primer_nombre"] == "ANA"
+    assert result["cc_data"] is None and result["doc16_data"] is None
+
+
+def test_lote_fallido_cae_a_llamadas_por_documento(pdf_falso):
+    client = FakeAsyncOpenAI({
+        "lote": TimeoutError("timeout del lote"),
+        "rut": DATOS_RUT,
+        "cc": DATOS_CC,
+        "doc16": DATOS_DOC16,
+    })
+
+    result = _run(_items(*TRES_DOCS), client)
+
+    assert client.llamadas[0] == "lote"
+    assert sorted(client.llamadas[1:]) == ["cc", "doc16", "rut"]
+    assert result["cc_data"]["doc_numero"] == "1020304050"
+    assert result["doc16_data"]["banco_nombre"] == "Bancolombia"
+    assert [d for d, _ in _errores(result, "WARNING") if d == "PIPELINE"] == ["PIPELINE"]
+    assert _errores(result) == []
+
+
+def test_lote_sin_una_clave_la_extrae_aparte(pdf_falso):
+    # El modelo devolvió "cc" como string: solo la cédula se pide aparte
+    client = FakeAsyncOpenAI({"lote": {"rut": DATOS_RUT, "cc": "?", "doc16": DATOS_DOC16}, "cc": DATOS_CC})
+
+    result = _run(_items(*TRES_DOCS), client)
+
+    assert client.llamadas == ["lote", "cc"]
+    assert result["cc_data"]["doc_numero"] == "1020304050"
+
+
+# =========================
+# 🧯 Aislamiento de fallos por documento
+# =========================
+def test_fallo_de_texto_aisla_al_documento(pdf_falso):
+    pdf_falso["cedula.pdf"] = RuntimeError("PDF corrupto")
+    client = FakeAsyncOpenAI({"lote": {"rut": DATOS_RUT, "doc16": DATOS_DOC16}})
+
+    result = _run(_items(*TRES_DOCS), client)
+
+    assert client.llamadas == ["lote"]
+    assert result["cc_data"] is None
+    assert result["rut_data"]["primer_apellido"] == "PEREZ"
+    assert result["doc16_data"]["numero_cuenta"] == "12345678901"
+    assert _errores(result) == [("CEDULA", "Error extrayendo texto: PDF corrupto")]
+    assert result["metricas"]["tiempo_por_documento_s"]["CEDULA"] is None
+
+
+def test_fallo_ia_de_un_documento_no_tumba_el_caso(pdf_falso):
+    client = FakeAsyncOpenAI({
+        "lote": ValueError("JSON inválido"),
+        "rut": DATOS_RUT,
+        "cc": RuntimeError("rate limit"),
+        "doc16": DATOS_DOC16,
+    })
+
+    result = _run(_items(*TRES_DOCS), client)
+
+    assert result["cc_data"] is None
+    assert result["rut_data"] is not None and result["doc16_data"] is not None
+    assert _errores(result) == [("CEDULA", "Error en extracción IA: rate limit")]
+
+
+def test_archivo_sin_clasificar_queda_en_unknown(pdf_falso):
+    client = FakeAsyncOpenAI({"rut": DATOS_RUT})
+
+    result = _run(_items("rut.pdf", "factura.pdf"), client)
+
+    assert client.llamadas == ["rut"]
+    assert result["uploads_resumen"]["UNKNOWN"] == ["factura.pdf"]
@@ -0,0 +1,147 @@
+import os
+
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    """Storage local aislado por test (nunca Supabase)."""
+    monkeypatch.setattr(storage, "_USE_SUPABASE", False)
+    monkeypatch.setattr(storage, "BASE_DIR", tmp_path)
+    storage._case_dir.cache_clear()
+    yield tmp_path
+    storage._case_dir.cache_clear()
+
+
+def test_save_upload_entry_es_idempotente_por_idx(local_storage):
+    case_id = "caso-1"
+    storage.save_upload_entry(case_id, 0, {"saved_name": "rut.pdf", "sha256": "a"})
+    # Reintento del mismo archivo (mismo idx): reemplaza, no duplica
+    storage.save_upload_entry(case_id, 0, {"saved_name": "rut.pdf", "sha256": "a"})
+
+    assert storage.get_uploads(case_id) == [{"saved_name": "rut.pdf", "sha256": "a"}]
+
+
+def test_save_upload_entry_reintento_sobrescribe(local_storage):
+    case_id = "caso-2"
+    storage.save_upload_entry(case_id, 3, {"saved_name": "v1.pdf"})
+    storage.save_upload_entry(case_id, 3, {"saved_name": "v2.pdf"})
+
+    assert storage.get_uploads(case_id) == [{"saved_name": "v2.pdf"}]
+
+
+def test_get_uploads_ordena_por_idx(local_storage):
+    case_id = "caso-3"
+    # Subidas concurrentes terminan en cualquier orden
+    for idx in (10, 2, 0, 1):
+        storage.save_upload_entry(case_id, idx, {"idx": idx})
+
+    assert [u["idx"] for u in storage.get_uploads(case_id)] == [0, 1, 2, 10]
+
+
+def test_get_uploads_combina_meta_y_entradas(local_storage):
+    case_id = "caso-4"
+    storage.save_case_meta(case_id, {"uploads": [{"saved_name": "lote.pdf"}]})
+    storage.save_upload_entry(case_id, 0, {"saved_name": "uno.pdf"})
+
+    assert [u["saved_name"] for u in storage.get_uploads(case_id)] == ["lote.pdf", "uno.pdf"]
+
+
+def test_get_uploads_caso_vacio(local_storage):
+    assert storage.get_uploads("caso-vacio") == []
+
+
+def test_get_uploads_con_entradas_no_busca_uploads_json(local_storage, monkeypatch):
+    case_id = "caso-5"
+    storage.save_status(case_id, "uploaded")  # meta.json sin clave "uploads", como /upload_one
+    storage.save_upload_entry(case_id, 0, {"saved_name": "uno.pdf"})
+
+    leidos = []
+    original = storage._read_json_or_none
+
+    def _espia(cid, sb_parts, *args):
+        leidos.append(sb_parts)
+        return original(cid, sb_parts, *args)
+
+    monkeypatch.setattr(storage, "_read_json_or_none", _espia)
+
+    assert storage.get_uploads(case_id) == [{"saved_name": "uno.pdf"}]
+    assert ("meta", "uploads.json") not in leidos
+
+
+def test_get_uploads_caso_anterior_con_uploads_json(local_storage):
+    case_id = "caso-6"
+    (local_storage / case_id).mkdir()
+    (local_storage / case_id / "uploads.json").write_bytes(
+        storage.dumps_json({"uploads": [{"saved_name": "viejo.pdf"}]})
+    )
+
+    assert storage.get_uploads(case_id) == [{"saved_name": "viejo.pdf"}]
+
+
+def test_save_case_meta_mergea_sobre_lo_guardado_no_el_cache(local_storage):
+    case_id = "caso-meta"
+    storage.save_case_meta(case_id, {"uploads": []})
+    assert storage.get_case_meta(case_id) == {"uploads": [], "case_id": case_id}  # queda en cache
+
+    # Otro proceso escribe meta.json; mismo mtime: el cache local no lo detecta
+    p = local_storage / case_id / "meta.json"
+    st = p.stat()
+    p.write_bytes(storage.dumps_json({"uploads": [{"saved_name": "a.pdf"}], "case_id": case_id}))
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    storage.save_status(case_id, "uploaded")
+
+    meta = storage.get_case_meta(case_id)
+    assert meta["uploads"] == [{"saved_name": "a.pdf"}]
+    assert meta["status"]["status"] == "uploaded"
+
+
+class _FakeBucket:
+    """Bucket de Supabase mínimo: download lanza la excepción configurada."""
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def download(self, path):
+        raise self.error
+
+
+class _FakeSupabase:
+    def __init__(self, error: Exception):
+        self.storage = self
+        self._bucket = _FakeBucket(error)
+
+    def from_(self, bucket):
+        return self._bucket
+
+
+@pytest.fixture
+def supabase_con_error(monkeypatch):
+    def _configurar(error: Exception):
+        monkeypatch.setattr(storage, "_USE_SUPABASE", True)
+        monkeypatch.setattr(storage, "get_supabase_client", lambda: _FakeSupabase(error))
+        storage._READ_CACHE.clear()
+    yield _configurar
+    storage._READ_CACHE.clear()
+
+
+def test_get_result_bytes_objeto_ausente_es_none(supabase_con_error):
+    supabase_con_error(Exception({"statusCode": "404", "error": "not_found", "message": "Object not found"}))
+    assert storage.get_result_bytes("caso") is None
+
+
+@pytest.mark.parametrize(
+    "lectura",
+    [
+        lambda: storage.get_result_bytes("caso"),
+        lambda: storage.get_case_meta("caso"),
+        lambda: storage.get_file_by_hash("a" * 64),
+        lambda: storage.get_case_by_hash("b" * 64),
+    ],
+)
+def test_lecturas_propagan_caida_de_supabase(supabase_con_error, lectura):
+    supabase_con_error(ConnectionError("supabase caído"))
+    with pytest.raises(ConnectionError):
+        lectura()
@@ -0,0 +1,20 @@
+import pytest
+
+import storage
+import supabase_config
+
+
+def test_storage_usa_el_cliente_de_supabase_config():
+    # Un solo cliente por proceso: storage no crea el suyo
+    assert storage.get_supabase_client is supabase_config.get_supabase_client
+
+
+def test_sin_variables_no_hay_cliente(monkeypatch):
+    monkeypatch.setattr(supabase_config, "SUPABASE_URL", "")
+    supabase_config.get_supabase_client.cache_clear()
+    try:
+        assert supabase_config.get_supabase_client() is None
+        with pytest.raises(RuntimeError, match="Faltan variables de entorno de Supabase"):
+            supabase_config.require_supabase_client()
+    finally:
+        supabase_config.get_supabase_client.cache_clear()
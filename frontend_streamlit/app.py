@@ -1,7 +1,25 @@
+import hashlib
+import io
+import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    # opcional: arma el multipart leyendo los archivos por bloques (sin el body completo en memoria)
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+except ImportError:  # pragma: no cover
+    MultipartEncoder = None
+
+try:
+    import orjson  # opcional: parsea /results (df_master + logs) en C
+except ImportError:  # pragma: no cover
+    orjson = None
 
 st.set_page_config(page_title="OCR Atenea (Frontend)", layout="wide")
 
@@ -72,7 +90,307 @@ def _is_localhost_url(url: str) -> bool:
     return "localhost" in low or "127.0.0.1" in low
 
 
-DEFAULT_BACKEND_URL = _clean_backend_url(_resolve_default_backend_url())
+@st.cache_resource
+def _http_session() -> requests.Session:
+    """
+    Una sola sesión HTTP por proceso de Streamlit: /upload, /process y /results
+    reusan la conexión keep-alive (sin un handshake TCP+TLS por llamada).
+    Reintenta errores transitorios (backend despertando, 502/503 del proxy) con backoff.
+    """
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # /results (df_master + logs) viaja comprimido: el backend tiene GZipMiddleware.
+    # Los uploads van sin comprimir (PDF/imagen ya están comprimidos)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+def _json(resp: requests.Response):
+    if orjson is not None:
+        return orjson.loads(resp.content)
+    return resp.json()
+
+
+def _post_multipart(url: str, fields: list, timeout: int, params: dict | None = None) -> requests.Response:
+    """
+    POST multipart en streaming: el body se lee de los archivos a medida que se envía.
+    Sin requests_toolbelt, requests arma el body completo en memoria (mismo resultado).
+    """
+    if MultipartEncoder is None:
+        return _http_session().post(url, files=fields, params=params, timeout=timeout)
+    encoder = MultipartEncoder(fields=fields)
+    return _http_session().post(
+        url, data=encoder, params=params, headers={"Content-Type": encoder.content_type}, timeout=timeout
+    )
+
+
+# Content-type por extensión (los mismos tipos que acepta el file_uploader)
+CONTENT_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+
+# Subidas simultáneas por caso (una request por archivo)
+UPLOAD_WORKERS = 8
+
+
+# /process corre en segundo plano en el backend; aquí solo se consulta su estado
+PROCESS_TIMEOUT_S = 1200
+POLL_INTERVAL_S = 1.0
+
+
+def _wait_for_case(backend_url: str, case_id: str, placeholder) -> dict:
+    """
+    Consulta GET /process/{case_id}/status hasta processed/error (o PROCESS_TIMEOUT_S).
+    Errores de red o 5xx al consultar no cortan la espera: backoff exponencial (máx. 30 s).
+    """
+    inicio = time.monotonic()
+    fallos = 0
+    estado: dict = {"status": "queued"}
+    while time.monotonic() - inicio < PROCESS_TIMEOUT_S:
+        try:
+            resp = _http_session().get(f"{backend_url}/process/{case_id}/status", timeout=30)
+            resp.raise_for_status()
+            estado = _json(resp)
+            fallos = 0
+        except requests.exceptions.RequestException:
+            fallos += 1
+
+        if estado.get("status") in ("processed", "error"):
+            return estado
+
+        placeholder.caption(f"Estado: {estado.get('status')} · {int(time.monotonic() - inicio)} s")
+        time.sleep(POLL_INTERVAL_S if not fallos else min(30.0, 0.5 * 2 ** fallos))
+
+    return {"status": "timeout"}
+
+
+# Reintentos de POST a nivel app: el adapter solo reintenta GET (un body en streaming no se rebobina)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+POST_RETRIES = 3
+
+
+def _es_reintentable(resp: requests.Response) -> bool:
+    if resp.status_code in RETRY_STATUS:
+        return True
+    if resp.status_code < 400:
+        return False
+    texto = resp.text[:500].lower()
+    return "rate limit" in texto or "quota" in texto
+
+
+def _post_con_reintentos(send, on_retry=None) -> requests.Response:
+    """
+    Ejecuta send() y lo repite ante error de red, 429/5xx o "rate limit"/"quota" en la respuesta.
+    Backoff exponencial 0.5 s → 8 s (o Retry-After si el backend lo indica).
+    send debe rearmar el body en cada intento.
+    """
+    intento = 0
+    while True:
+        resp = None
+        try:
+            resp = send()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if intento == POST_RETRIES:
+                raise
+        else:
+            if intento == POST_RETRIES or not _es_reintentable(resp):
+                return resp
+
+        espera = min(8.0, 0.5 * 2 ** intento)
+        retry_after = resp.headers.get("Retry-After", "") if resp is not None else ""
+        if retry_after.isdigit():
+            espera = min(8.0, float(retry_after))
+        if on_retry is not None:
+            on_retry(intento + 1, espera)
+        time.sleep(espera)
+        intento += 1
+
+
+def _hashes_conocidos(backend_url: str, hashes: list[str]) -> set[str]:
+    """
+    Una sola request para todo el lote: qué contenidos ya tiene el backend.
+    Si falla (o el backend no tiene el endpoint), se sube todo normalmente.
+    """
+    try:
+        resp = _http_session().post(
+            f"{backend_url}/uploads/known", json={"sha256": sorted(set(hashes))}, timeout=30
+        )
+        if resp.status_code != 200:
+            return set()
+        return set(_json(resp).get("known", []))
+    except requests.exceptions.RequestException:
+        return set()
+
+
+def _upload_one(
+    backend_url: str, f, ct: str, sha256: str, conocido: bool, idx: int, case_id: str | None, on_retry=None
+) -> requests.Response:
+    params = {"idx": idx} if case_id is None else {"idx": idx, "case_id": case_id}
+
+    # El backend ya tiene este contenido (mismo sha256): se registra sin reenviar los bytes.
+    # 404 = ya no está disponible -> se sube normalmente
+    if conocido:
+        known = _post_con_reintentos(
+            lambda: _http_session().post(
+                f"{backend_url}/upload_known",
+                params={"sha256": sha256, "filename": f.name, **params},
+                timeout=60,
+            ),
+            on_retry,
+        )
+        if known.status_code != 404:
+            return known
+
+    def send() -> requests.Response:
+        f.seek(0)
+        return _post_multipart(f"{backend_url}/upload_one", [("file", (f.name, f, ct))], timeout=300, params=params)
+
+    return _post_con_reintentos(send, on_retry)
+
+
+def _avisar_reintento(etapa: str):
+    return lambda n, espera: st.warning(f"{etapa}: error transitorio, reintentando ({n}/{POST_RETRIES}) en {espera:.1f} s…")
+
+
+def _sha256_archivos(files: list) -> list[str]:
+    # getbuffer() no copia: el sha256 se calcula sobre el buffer del UploadedFile
+    return [hashlib.sha256(f.getbuffer()).hexdigest() for f in files]
+
+
+def _subir_y_procesar(backend_url: str, files: list, hashes: list[str]) -> str:
+    """Sube los archivos (hashes = su sha256, en el mismo orden), procesa el caso y devuelve su case_id."""
+    with st.spinner("Subiendo archivos al backend..."):
+        # UploadedFile es un BytesIO: se pasa el objeto, sin copiarlo con getvalue()
+        pares = [
+            (
+                f,
+                CONTENT_TYPES.get(os.path.splitext(f.name)[1].lower()) or f.type or "application/octet-stream",
+                sha,
+            )
+            for f, sha in zip(files, hashes)
+        ]
+
+        vistos: dict[str, str] = {}
+        for f, _, sha in pares:
+            if sha in vistos:
+                st.warning(f"`{f.name}` tiene el mismo contenido que `{vistos[sha]}`.")
+            vistos.setdefault(sha, f.name)
+
+        conocidos = _hashes_conocidos(backend_url, list(vistos))
+        pares = [(f, ct, sha, sha in conocidos) for f, ct, sha in pares]
+
+        # El primer archivo crea el caso; el resto se sube en paralelo a ese case_id
+        try:
+            up = _upload_one(backend_url, *pares[0], 0, None, on_retry=_avisar_reintento("/upload_one"))
+            respuestas = [up]
+            if up.status_code == 200 and len(pares) > 1:
+                case_id = _json(up)["case_id"]
+                with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(pares) - 1)) as ex:
+                    respuestas += list(
+                        ex.map(lambda i: _upload_one(backend_url, *pares[i], i, case_id), range(1, len(pares)))
+                    )
+        except requests.exceptions.RequestException as exc:
+            st.error(
+                "No se pudo conectar con el backend. "
+                "Revisa que `Backend URL` sea accesible públicamente y que el backend esté encendido."
+            )
+            st.exception(exc)
+            st.stop()
+
+        for resp in respuestas:
+            if resp.status_code != 200:
+                st.error(f"Error en /upload_one: {resp.status_code} - {resp.text}")
+                st.stop()
+
+        case_id = _json(up)["case_id"]
+        st.success(f"✅ Upload listo ({len(respuestas)} archivos). case_id: {case_id}")
+
+    with st.spinner("Procesando en backend (OCR + extracción + validaciones)..."):
+        # Responde 202 al instante; el avance se consulta por /process/{case_id}/status
+        try:
+            pr = _post_con_reintentos(
+                lambda: _http_session().post(
+                    f"{backend_url}/process/{case_id}", params={"background": "true"}, timeout=60
+                ),
+                on_retry=_avisar_reintento("/process"),
+            )
+        except requests.exceptions.RequestException as exc:
+            st.error("Fallo de conexión en /process. Revisa backend URL y estado del backend.")
+            st.exception(exc)
+            st.stop()
+
+        if pr.status_code not in (200, 202):
+            st.error(f"Error en /process: {pr.status_code} - {pr.text}")
+            st.stop()
+
+        estado = _wait_for_case(backend_url, case_id, st.empty())
+        if estado.get("status") == "error":
+            st.error(f"Error en /process: {estado.get('detail')}")
+            st.stop()
+        if estado.get("status") != "processed":
+            st.error(f"El procesamiento no terminó en {PROCESS_TIMEOUT_S} s. case_id: {case_id}")
+            st.stop()
+
+    st.success("✅ Procesamiento completo")
+    return case_id
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_results(backend_url: str, case_id: str) -> dict:
+    """GET /results cacheado: los reruns de Streamlit (cualquier widget) no vuelven a pedirlo."""
+    rr = _http_session().get(f"{backend_url}/results/{case_id}", timeout=300)
+    rr.raise_for_status()
+    return _json(rr)
+
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_excel(backend_url: str, case_id: str) -> bytes:
+    """Baja el Excel por la misma sesión keep-alive, por bloques de 64 KB."""
+    buf = io.BytesIO()
+    with _http_session().get(f"{backend_url}/export/{case_id}", stream=True, timeout=600) as r:
+        r.raise_for_status()
+        for chunk in r.iter_content(chunk_size=1 << 16):
+            buf.write(chunk)
+    return buf.getvalue()
+
+
+def _files_key(backend_url: str, files: list, hashes: list[str]) -> tuple:
+    # Por contenido (sha256), no por tamaño: dos archivos distintos pueden pesar lo mismo.
+    # El nombre también cuenta: el backend clasifica cada documento por su nombre.
+    return backend_url, tuple((f.name, sha) for f, sha in zip(files, hashes))
+
+
+# Filas por página en las tablas: al navegador solo viaja la página visible
+PAGE_SIZE = 100
+
+
+def _tabla_paginada(rows: list, key: str) -> None:
+    paginas = max(1, math.ceil(len(rows) / PAGE_SIZE))
+    pagina = 1
+    if paginas > 1:
+        pagina = st.number_input(
+            f"Página (de {paginas}, {len(rows)} filas)", min_value=1, max_value=paginas, value=1, key=key
+        )
+    inicio = (pagina - 1) * PAGE_SIZE
+    st.dataframe(rows[inicio:inicio + PAGE_SIZE], use_container_width=True)
+
+
+@st.cache_resource
+def _default_backend_url() -> str:
+    """Secrets + env se resuelven una vez por proceso, no en cada rerun del script."""
+    return _clean_backend_url(_resolve_default_backend_url())
+
+
+DEFAULT_BACKEND_URL = _default_backend_url()
 
 if "backend_url" not in st.session_state:
     st.session_state.backend_url = DEFAULT_BACKEND_URL
@@ -128,57 +446,31 @@ if do_process and files:
         st.error("`Backend URL` es obligatorio. Ingresa la URL de tu backend para continuar.")
         st.stop()
 
-    with st.spinner("Subiendo archivos al backend..."):
-        multi = []
-        for f in files:
-            # content-type aproximado
-            ct = "application/pdf" if f.name.lower().endswith(".pdf") else "image/jpeg"
-            multi.append(("files", (f.name, f.getvalue(), ct)))
-
-        try:
-            up = requests.post(f"{BACKEND_URL}/upload", files=multi, timeout=300)
-        except requests.exceptions.RequestException as exc:
-            st.error(
-                "No se pudo conectar con el backend. "
-                "Revisa que `Backend URL` sea accesible públicamente y que el backend esté encendido."
-            )
-            st.exception(exc)
-            st.stop()
-
-        if up.status_code != 200:
-            st.error(f"Error en /upload: {up.status_code} - {up.text}")
-            st.stop()
-
-        case_id = up.json()["case_id"]
-        st.success(f"✅ Upload listo. case_id: {case_id}")
-
-    with st.spinner("Procesando en backend (OCR + extracción + validaciones)..."):
-        try:
-            pr = requests.post(f"{BACKEND_URL}/process/{case_id}", timeout=1200)
-        except requests.exceptions.RequestException as exc:
-            st.error("Fallo de conexión en /process. Revisa backend URL y estado del backend.")
-            st.exception(exc)
-            st.stop()
-
-        if pr.status_code != 200:
-            st.error(f"Error en /process: {pr.status_code} - {pr.text}")
-            st.stop()
-
-    st.success("✅ Procesamiento completo")
+    # Mismos archivos que el último caso: no se re-sube ni se re-procesa
+    hashes = _sha256_archivos(files)
+    files_key = _files_key(BACKEND_URL, files, hashes)
+    caso = st.session_state.get("caso")
+    if caso and caso["files_key"] == files_key:
+        st.info(f"Mismos archivos del caso {caso['case_id']}: se muestran sus resultados.")
+    else:
+        case_id = _subir_y_procesar(BACKEND_URL, files, hashes)
+        st.session_state.caso = {"files_key": files_key, "backend_url": BACKEND_URL, "case_id": case_id}
 
+# Los resultados quedan en pantalla en los reruns (no solo justo después del click)
+caso = st.session_state.get("caso")
+if caso:
+    case_id = caso["case_id"]
     with st.spinner("Cargando resultados..."):
         try:
-            rr = requests.get(f"{BACKEND_URL}/results/{case_id}", timeout=300)
+            payload = _fetch_results(caso["backend_url"], case_id)
+        except requests.exceptions.HTTPError as exc:
+            st.error(f"Error en /results: {exc.response.status_code} - {exc.response.text}")
+            st.stop()
         except requests.exceptions.RequestException as exc:
             st.error("Fallo de conexión en /results. Revisa backend URL y estado del backend.")
             st.exception(exc)
             st.stop()
 
-        if rr.status_code != 200:
-            st.error(f"Error en /results: {rr.status_code} - {rr.text}")
-            st.stop()
-
-        payload = rr.json()
         result = payload.get("result", {})
         metricas = result.get("metricas", {})
         logs = result.get("logs", {}).get("items", [])
@@ -189,17 +481,28 @@ if do_process and files:
 
     st.subheader("3) Tabla master (preview)")
     if df_master:
-        st.dataframe(df_master, use_container_width=True)
+        _tabla_paginada(df_master, key="pagina_master")
     else:
         st.info("No hay filas en df_master (aún).")
 
     st.subheader("4) Logs")
     if logs:
-        st.dataframe(logs, use_container_width=True)
+        _tabla_paginada(logs, key="pagina_logs")
     else:
         st.info("Sin logs.")
 
     st.subheader("5) Descargar Excel")
-    excel_url = f"{BACKEND_URL}/export/{case_id}"
-    st.markdown(f"➡️ Descarga desde: {excel_url}")
-    # Si quieres, puedes bajar el Excel en memoria y usar st.download_button.
+    try:
+        excel_bytes = _fetch_excel(caso["backend_url"], case_id)
+    except requests.exceptions.RequestException:
+        # Respaldo: enlace directo al backend
+        excel_url = f"{caso['backend_url']}/export/{case_id}"
+        st.warning("No se pudo bajar el Excel desde aquí.")
+        st.markdown(f"➡️ Descarga desde: {excel_url}")
+    else:
+        st.download_button(
+            "⬇️ Descargar Excel",
+            data=excel_bytes,
+            file_name=f"ocr_atenea_{case_id}.xlsx",
+            mime=XLSX_MIME,
+        )